@@ -14,11 +14,11 @@
 
 from paramodai.forward_analysis import ForwardAnalyzer
 from paramodai.instruction import RETURN_ADDR
+from paramodai.query import QueryEngine
 from paramodai.term import Term
 from paramodai.state import AbstractState
 from paramodai.x86 import ESP, DWORD
 from paramodai.test_runner import run_test
-from z3 import unsat
 import sys
 
 
@@ -46,12 +46,13 @@ def test_build_lists():
     a.set_func_transformer("random_selector", random_selector_transformer)
     a.run_from_func("build_lists")
 
-    ret_state = a.get_state(RETURN_ADDR)
-    solver = ret_state.get_solver()
+    queries = QueryEngine(a)
 
     # verify that x (stk_-c) != y (stk_-10) (x not connected to y)
-    solver.add(Term.get("stk_-c").z3_expr == Term.get("stk_-10").z3_expr)
-    if solver.check() != unsat:
+    queries.add(RETURN_ADDR, [
+        Term.get("stk_-c").z3_expr == Term.get("stk_-10").z3_expr])
+    queries.run()
+    if queries.failed:
         raise Exception("Proof failed!")
 
 
@@ -1,7 +1,8 @@
 from paramodai.forward_analysis import ForwardAnalyzer
+from paramodai.incremental_solver import IncrementalSolver
+from paramodai.query import QueryEngine
 from paramodai.term import Term
 from paramodai.test_runner import run_test
-from z3 import unsat
 import sys
 
 
@@ -16,28 +17,22 @@ def test_cve_2014_7841():
 
     a.run_from_func("cve_2014_7841")
 
-    # iterate over all memory loads
+    # a single solver shared by all the queried states
+    queries = QueryEngine(a, IncrementalSolver())
+
+    # check every memory load (an assignment whose src is_deref)
     for bb in a.cfg.basic_blocks.itervalues():
         for instr in bb:
             for dst, src in instr.assignments:
-
-                # check that assignment is a memory load (src.is_deref)
                 if src.is_deref:
-
-                    # calculate state right before memory load
-                    # by advancing the state at the start of the BB
-                    state = a[bb].copy()
-                    for instr2 in bb:
-                        if instr == instr2:
-                            break
-                        a._apply_instr(state, instr2)
-
-                    solver = state.get_solver()
-                    # verify that address cannot be NULL (0)
-                    solver.add(src.addr.z3_expr == Term.get(0).z3_expr)
-                    if solver.check() != unsat:
-                        raise Exception(
-                            "Could not prove safe deref on %r" % instr)
+                    # the address cannot be NULL (0)
+                    queries.add(instr.addr,
+                                [src.addr.z3_expr == Term.get(0).z3_expr],
+                                instr)
+
+    for query in queries.run():
+        if not query.is_proved:
+            raise Exception("Could not prove safe deref on %r" % query.name)
 
 
 if __name__ == "__main__":
@@ -1,9 +1,9 @@
 from paramodai.forward_analysis import ForwardAnalyzer
 from paramodai.instruction import RETURN_ADDR
+from paramodai.query import QueryEngine
 from paramodai.term import Term
 from paramodai.x86 import ESP, DWORD
 from paramodai.test_runner import run_test
-from z3 import unsat
 import sys
 
 
@@ -22,14 +22,15 @@ def test_resource_manager():
     a.assign(Term.get(1), Term.get(2), True)
 
     a.run_from_func("resource_manager")
-    ret_state = a.get_state(RETURN_ADDR)
-    solver = ret_state.get_solver()
+    queries = QueryEngine(a)
 
     # verify that is_camera_on=1 -> is_mic_on=1
     # is_camera_on is stk_-18, is_mic_on is stk_-14
-    solver.add(Term.get("stk_-14").z3_expr != Term.get(0).z3_expr)
-    solver.add(Term.get("stk_-18").z3_expr != Term.get(1).z3_expr)
-    if solver.check() != unsat:
+    queries.add(RETURN_ADDR, [
+        Term.get("stk_-14").z3_expr != Term.get(0).z3_expr,
+        Term.get("stk_-18").z3_expr != Term.get(1).z3_expr])
+    queries.run()
+    if queries.failed:
         raise Exception("Proof failed!")
 
 
@@ -13,7 +13,8 @@
 # limitations under the License.
 
 from z3 import BoolVal, simplify
-from paramodai.term import TRUE
+from paramodai.term import Term, TRUE
+from paramodai.z3_translator import Z3Translator
 
 Z3_FALSE = BoolVal(False)
 Z3_TRUE = BoolVal(True)
@@ -23,12 +24,11 @@ class Atom(object):
 
     _atom_cache = {}
 
-    __slots__ = ("terms", "names", "atomic_names", "_z3_expr")
+    __slots__ = ("terms", "names", "atomic_names")
 
     def __init__(self, *terms):
         assert len(terms) == 2
         self.terms = terms
-        self._z3_expr = None
         self.names = self.terms[0].names | self.terms[1].names
         self.atomic_names = (self.terms[0].atomic_names |
                              self.terms[1].atomic_names)
@@ -60,11 +60,7 @@ class Atom(object):
 
     @property
     def z3_expr(self):
-        value = self._z3_expr
-        if value is None:
-            value = (self.terms[0].z3_expr == self.terms[1].z3_expr)
-            self._z3_expr = value
-        return value
+        return Z3Translator.get_active().translate_atom(self)
 
     def __repr__(self):
         if self.is_cmp:
@@ -100,7 +96,7 @@ class Atom(object):
         cache = Atom._atom_cache
 
         if terms[1] != TRUE:
-            key = tuple(sorted(terms))
+            key = tuple(sorted(terms, key=Term.get_order))
             if key != terms:
                 return Atom.get(*key)
 
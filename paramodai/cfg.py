@@ -19,7 +19,7 @@ from paramodai.instruction import RETURN_ADDR
 class BasicBlock(object):
 
     __slots__ = ("addr", "cfg", "succs", "preds",
-                 "instrs", "_successors", "backgoing_addrs")
+                 "instrs", "_successors", "backgoing_addrs", "_fused")
 
     _addr_cache = {}
 
@@ -46,6 +46,7 @@ class BasicBlock(object):
         self.succs = set([x[0] for x in self._successors])
         self.preds = set()
         self.backgoing_addrs = set()
+        self._fused = None
 
     @staticmethod
     def get(addr, cfg):
@@ -62,7 +63,39 @@ class BasicBlock(object):
 
     @property
     def succ_edges(self):
-        for addr, assertions, assignments in self._successors:
+        return self.get_succ_edges()
+
+    def _get_fused(self):
+        # computed on first use, after the stack analysis has resolved
+        # the compared operands
+        if self._fused is None:
+            if self.is_dummy:
+                self._fused = frozenset(), self._successors
+            else:
+                self._fused = self.instrs[-1].fuse_compare(self.instrs)
+        return self._fused
+
+    @property
+    def fused_compares(self):
+        return self._get_fused()[0]
+
+    @property
+    def fused_rank(self):
+        # the highest rank of a fused branch condition, as it is added to
+        # the state: an (in)equality of the operands, or a comparison term
+        # over them
+        rank = 0
+        for _, assertions, _ in self._get_fused()[1]:
+            for cond, term1, term2 in assertions:
+                cond_rank = max(term1.rank, term2.rank)
+                if cond not in ("eq", "ne"):
+                    cond_rank += 1
+                rank = max(rank, cond_rank)
+        return rank
+
+    def get_succ_edges(self, fused=False):
+        successors = self._get_fused()[1] if fused else self._successors
+        for addr, assertions, assignments in successors:
             is_backward = addr in self.backgoing_addrs
             yield self.cfg[addr], assertions, assignments, is_backward
 
@@ -128,7 +161,8 @@ class BasicBlock(object):
 
 class CFG(object):
 
-    __slots__ = "entry_addr", "executable", "bb_entries", "basic_blocks"
+    __slots__ = ("entry_addr", "executable", "bb_entries", "basic_blocks",
+                 "_wto")
 
     _cfg_cache = {}
 
@@ -140,6 +174,7 @@ class CFG(object):
         self.bb_entries = self._get_bb_entries()
         self._build_cfg()
         self._mark_backward_edges()
+        self._wto = None
 
     @property
     def entry_bb(self):
@@ -212,5 +247,96 @@ class CFG(object):
                 if self[succ_addr] in dom[bb]:
                     bb.backgoing_addrs.add(succ_addr)
 
+    def _get_succ_bbs(self, bb):
+        return [self[x] for x in sorted(bb.succs)]
+
+    @property
+    def wto(self):
+        # the weak topological ordering of the blocks (Bourdoncle). a
+        # component is a list whose first element is its head, and whose
+        # other elements are blocks or nested components
+        if self._wto is None:
+            self._wto = self._get_wto()
+        return self._wto
+
+    def _get_wto(self):
+        # Bourdoncle's recursive visit, run over an explicit stack of calls
+        # so deep CFGs do not hit the recursion limit. a call is
+        # [VISIT, v, partition, successors, head, loop] or
+        # [COMPONENT, v, partition, successors, inner partition, head].
+        # partitions are built in reverse and reversed once complete
+        VISIT, COMPONENT = 0, 1
+        dfn = {}
+        stack = []
+        calls = []
+        counter = [0]
+        infinity = float("inf")
+
+        def visit(v, partition):
+            stack.append(v)
+            counter[0] += 1
+            dfn[v] = counter[0]
+            calls.append([VISIT, v, partition,
+                          iter(self._get_succ_bbs(v)), dfn[v], False])
+
+        partition = []
+        visit(self.entry_bb, partition)
+        # the head returned by the call that just ended
+        ret = None
+        while calls:
+            call = calls[-1]
+            if call[0] == VISIT:
+                _, v, call_partition, succs, head, loop = call
+                if ret is not None:
+                    if ret <= head:
+                        head = ret
+                        loop = True
+                    ret = None
+                called = False
+                for w in succs:
+                    min_dfn = dfn.get(w, 0)
+                    if min_dfn == 0:
+                        visit(w, call_partition)
+                        called = True
+                        break
+                    if min_dfn <= head:
+                        head = min_dfn
+                        loop = True
+                call[4] = head
+                call[5] = loop
+                if called:
+                    continue
+                calls.pop()
+                if head == dfn[v]:
+                    dfn[v] = infinity
+                    element = stack.pop()
+                    if loop:
+                        while element is not v:
+                            dfn[element] = 0
+                            element = stack.pop()
+                        calls.append([COMPONENT, v, call_partition,
+                                      iter(self._get_succ_bbs(v)), [], head])
+                        continue
+                    call_partition.append(v)
+                ret = head
+            else:
+                _, v, call_partition, succs, inner, head = call
+                ret = None
+                called = False
+                for w in succs:
+                    if dfn.get(w, 0) == 0:
+                        visit(w, inner)
+                        called = True
+                        break
+                if called:
+                    continue
+                calls.pop()
+                inner.reverse()
+                call_partition.append([v] + inner)
+                ret = head
+
+        partition.reverse()
+        return partition
+
     def __repr__(self):
         return "CFG: " + hex(self.entry_addr)
@@ -14,21 +14,25 @@
 
 from paramodai.literal import FalseLiteral, TrueLiteral
 from itertools import chain, combinations, imap
-from z3 import BoolVal, Or, Not, FreshInt, ForAll
+from paramodai.z3_translator import Z3Translator
 
 
 class Clause(object):
 
-    __slots__ = ("literals", "_z3_expr", "_z3_not_expr", "_names", "_atomic_names")
+    __slots__ = ("literals", "_names", "_atomic_names", "_features", "_id",
+                 "_fingerprint")
 
     _clauses_cache = {}
+    # clauses are interned, so every clause gets a dense id on first use
+    _next_id = 0
 
     def __init__(self, literals):
         self.literals = literals
         self._names = None
         self._atomic_names = None
-        self._z3_expr = None
-        self._z3_not_expr = None
+        self._features = None
+        self._id = None
+        self._fingerprint = None
 
     def __repr__(self):
         return " ; ".join(map(repr, self.literals))
@@ -48,6 +52,38 @@ class Clause(object):
             self._atomic_names = self._get_atomic_names()
         return self._atomic_names
 
+    @property
+    def id(self):
+        value = self._id
+        if value is None:
+            value = Clause._next_id
+            Clause._next_id += 1
+            self._id = value
+        return value
+
+    @property
+    def fingerprint(self):
+        # a well mixed 63 bit hash of the id (the splitmix64 finalizer),
+        # so the xor of the fingerprints of a set is a good hash of the set
+        value = self._fingerprint
+        if value is None:
+            mask = 0xffffffffffffffff
+            value = (self.id + 0x9e3779b97f4a7c15) & mask
+            value = ((value ^ (value >> 30)) * 0xbf58476d1ce4e5b9) & mask
+            value = ((value ^ (value >> 27)) * 0x94d049bb133111eb) & mask
+            value = int((value ^ (value >> 31)) >> 1)
+            self._fingerprint = value
+        return value
+
+    @property
+    def features(self):
+        value = self._features
+        if value is None:
+            neg_count = len([l for l in self.literals if l.sign])
+            value = (len(self.literals) - neg_count, neg_count)
+            self._features = value
+        return value
+
     @property
     def rank(self):
         if not self.literals:
@@ -71,6 +107,11 @@ class Clause(object):
         return Clause.get({l.rename(old_name, new_name)
                            for l in self.literals})
 
+    def assign(self, value):
+        if self.is_ground:
+            return self
+        return Clause.get({l.assign(value) for l in self.literals})
+
     def __iter__(self):
         for l in self.literals:
             yield l
@@ -108,35 +149,11 @@ class Clause(object):
 
     @property
     def z3_expr(self):
-        value = self._z3_expr
-        if value is None:
-            if not self:
-                value = BoolVal(False)
-            else:
-                unique_var = FreshInt()
-
-                if self.is_ground:
-                    sub_exprs = [l.z3_expr for l in self]
-                else:
-                    sub_exprs = [l.assign_z3_expr(unique_var) for l in self]
-
-                if len(self) == 1:
-                    value = sub_exprs[0]
-                else:
-                    value = Or(*sub_exprs)
-
-                if not self.is_ground:
-                    value = ForAll(unique_var, value)
-            self._z3_expr = value
-        return value
+        return Z3Translator.get_active().translate_clause(self)
 
     @property
     def z3_not_expr(self):
-        value = self._z3_not_expr
-        if value is None:
-            value = Not(self.z3_expr)
-            self._z3_not_expr = value
-        return value
+        return Z3Translator.get_active().translate_clause_negation(self)
 
     @property
     def must_keep(self):
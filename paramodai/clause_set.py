@@ -0,0 +1,212 @@
+# Copyright 2017 Or Ozeri
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from paramodai.cow_dict import CowDict, CowSetDict
+
+WORD_BITS = 6
+WORD_MASK = (1 << WORD_BITS) - 1
+
+
+class ClauseSet(object):
+
+    # _watched maps every clause in the set to the literal it is filed under
+    # in _watch_index, and doubles as the membership table.
+    # _bitmap has a bit for the id of every clause in the set. it maps the
+    # index of every non zero 64 bit word to the word, so it is as large
+    # as the set and is copied in O(1), and comparing sets is word parallel.
+    # fingerprint is the xor of the fingerprints of the clauses, so sets
+    # which differ are usually told apart without comparing them
+
+    __slots__ = ("_watched", "_watch_index", "_lit_index", "_name_index",
+                 "_len", "_bitmap", "fingerprint")
+
+    def __init__(self, clauses=()):
+        self._watched = CowDict()
+        self._watch_index = CowSetDict()
+        self._lit_index = CowSetDict()
+        self._name_index = CowSetDict()
+        self._len = 0
+        self._bitmap = CowDict()
+        self.fingerprint = 0
+        self.update(clauses)
+
+    def add(self, c):
+        if c in self._watched:
+            return
+        lit_index = self._lit_index
+        watched_lit = None
+        if c:
+            # every clause is watched by its currently rarest literal, so
+            # forward subsumption only visits one index entry per candidate
+            watched_lit = min(c, key=lambda x: len(lit_index.get(x, ())))
+            self._watch_index.add(watched_lit, c)
+        self._watched[c] = watched_lit
+        for l in c:
+            lit_index.add(l, c)
+        name_index = self._name_index
+        for name in c.names:
+            name_index.add(name, c)
+        self._len += 1
+        i = c.id
+        bitmap = self._bitmap
+        word = i >> WORD_BITS
+        bitmap[word] = bitmap.get(word, 0) | 1 << (i & WORD_MASK)
+        self.fingerprint ^= c.fingerprint
+
+    def discard(self, c):
+        if c not in self._watched:
+            return
+        watched_lit = self._watched.pop(c)
+        if watched_lit is not None:
+            self._watch_index.remove(watched_lit, c)
+        lit_index = self._lit_index
+        for l in c:
+            lit_index.remove(l, c)
+        name_index = self._name_index
+        for name in c.names:
+            name_index.remove(name, c)
+        self._len -= 1
+        i = c.id
+        bitmap = self._bitmap
+        word = i >> WORD_BITS
+        value = bitmap[word] & ~(1 << (i & WORD_MASK))
+        if value:
+            bitmap[word] = value
+        else:
+            bitmap.pop(word)
+        self.fingerprint ^= c.fingerprint
+
+    def remove(self, c):
+        if c not in self._watched:
+            raise KeyError(c)
+        self.discard(c)
+
+    def update(self, clauses):
+        for c in clauses:
+            self.add(c)
+
+    def difference_update(self, clauses):
+        for c in list(clauses):
+            self.discard(c)
+
+    def copy(self):
+        res = ClauseSet.__new__(ClauseSet)
+        res._watched = self._watched.copy()
+        res._watch_index = self._watch_index.copy()
+        res._lit_index = self._lit_index.copy()
+        res._name_index = self._name_index.copy()
+        res._len = self._len
+        res._bitmap = self._bitmap.copy()
+        res.fingerprint = self.fingerprint
+        return res
+
+    def get_members(self):
+        # the clauses of the set as a CowDict, copied in O(1)
+        return self._watched.copy()
+
+    def with_literal(self, l):
+        return self._lit_index.get(l, ())
+
+    def with_name(self, name):
+        return self._name_index.get(name, ())
+
+    @property
+    def names(self):
+        return set(self._name_index)
+
+    def is_subsumed(self, c):
+        pos_count, neg_count = c.features
+        literals = c.literals
+        watch_index = self._watch_index
+        for l in c:
+            for c2 in watch_index.get(l, ()):
+                if c2 is c:
+                    continue
+                pos_count2, neg_count2 = c2.features
+                if pos_count2 > pos_count or neg_count2 > neg_count:
+                    continue
+                if c2.literals <= literals:
+                    return True
+        return False
+
+    def subsumes_literals(self, literals):
+        # checks if some clause is a subset of the given literals
+        n = len(literals)
+        watch_index = self._watch_index
+        for l in literals:
+            for c2 in watch_index.get(l, ()):
+                if len(c2.literals) <= n and c2.literals <= literals:
+                    return True
+        return False
+
+    def get_subsumed(self, c):
+        if not c:
+            return set(self) - {c}
+        lit_index = self._lit_index
+        candidates = []
+        for l in c:
+            clauses = lit_index.get(l, None)
+            if clauses is None:
+                return set()
+            candidates.append(clauses)
+        candidates.sort(key=len)
+        res = candidates[0].intersection(*candidates[1:])
+        res.discard(c)
+        return res
+
+    def __contains__(self, c):
+        return c in self._watched
+
+    def __iter__(self):
+        return iter(self._watched)
+
+    def __len__(self):
+        return self._len
+
+    def __eq__(self, other):
+        if not isinstance(other, ClauseSet) or len(self) != len(other) or \
+                self.fingerprint != other.fingerprint:
+            return False
+        return self._bitmap == other._bitmap
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __and__(self, other):
+        # a copy of the smaller set, without the clauses the other lacks
+        if len(other) < len(self):
+            self, other = other, self
+        res = self.copy()
+        res.difference_update([c for c in self if c not in other])
+        return res
+
+    def __sub__(self, other):
+        res = self.copy()
+        if len(other) < len(self):
+            res.difference_update(other)
+        else:
+            res.difference_update([c for c in self if c in other])
+        return res
+
+    def __or__(self, other):
+        res = self.copy()
+        res.update(other)
+        return res
+
+    def __ior__(self, other):
+        self.update(other)
+        return self
+
+    def __repr__(self):
+        return "ClauseSet(%r)" % list(self)
@@ -13,11 +13,14 @@
 # limitations under the License.
 
 from paramodai.term import Term
-from paramodai.literal import FalseLiteral, TrueLiteral
+from paramodai.literal import Literal, FalseLiteral, TrueLiteral
+from paramodai.atom import Atom
 from paramodai.clause import Clause
 from paramodai.paramodulator import Paramodulator
 from paramodai.unordered_para import UnorderedParamodulator
+from paramodai.term_index import TermIndex
 from z3 import unsat, Solver
+from heapq import heappush, heappop
 
 
 class EmptyClauseException(Exception):
@@ -28,20 +31,34 @@ class ConsequenceFinder(object):
 
     PRUNE_THRESHOLD = 100
 
+    # every AGE_RATIO-th given clause is the oldest passive clause rather
+    # than the lightest one, so heavy clauses are not starved
+    AGE_RATIO = 5
+
     def __init__(
-            self, state, name_to_kill,
+            self, state, names_to_kill,
             max_clause_size=2, max_clause_rank=1,
-            remove_redundant_clauses=False):
+            remove_redundant_clauses=False, demodulate=True,
+            saturated_clauses=None):
         self.state = state
-        self.name_to_kill = name_to_kill
+        # the names are eliminated together, on top of Term.BASE_ORDER
+        names_to_kill = list(names_to_kill or ())
+        self.names_to_kill = frozenset(names_to_kill)
         self.max_clause_size = max_clause_size
         self.max_clause_rank = max_clause_rank
         self.remove_redundant_clauses = remove_redundant_clauses
+        # demodulation needs the term ordering, which only exists when
+        # killing names
+        self.demodulate = demodulate and bool(names_to_kill)
+
+        # oriented ground unit equalities: lhs -> (rhs, unit clause)
+        self._units = {}
+        self._normal_forms = {}
 
-        if name_to_kill is None:
+        if not names_to_kill:
             self._paramodulator = UnorderedParamodulator(self)
         else:
-            self.names_order = Term.BASE_ORDER + [name_to_kill]
+            self.names_order = Term.BASE_ORDER + names_to_kill
             self._compare_terms_cache = {}
             self._compare_literals_cache = {}
             self._compare_clauses_cache = {}
@@ -56,14 +73,32 @@ class ConsequenceFinder(object):
         # self._result_of_base_clauses = set()
 
         self._clauses = []
-        self._worklist = set()
+        self._clause_order = {}
+        # only active clauses (ones which were already given) are indexed,
+        # so every pair of clauses is considered once
+        # maximal sides of positive literals (superposition "from" terms)
+        self._from_index = TermIndex()
+        # all subterms of maximal sides (superposition "into" terms)
+        self._into_index = TermIndex()
+        self._passive = set()
+        self._weight_heap = []
+        self._age_heap = []
+        self._given_count = 0
         # self._base_worklist = set()
         self._seen_clauses = set()
-        for c in self.state.clauses:
-            self.add_to_worklist(c)
+        for c in list(self.state.clauses):
+            if saturated_clauses is not None and c in saturated_clauses:
+                # already closed under the rules, so c is active right away
+                # and only takes part in inferences with new clauses
+                self._seen_clauses.add(c)
+                self._clauses.append(c)
+                self._clause_order[c] = len(self._clause_order)
+                self._index_clause(c)
+            else:
+                self.add_to_worklist(c)
 
         if self.remove_redundant_clauses:
-            self._solver = self.state.get_solver()
+            self._solver = self.state.get_ground_solver()
             self._time_to_prune = len(self) + self.PRUNE_THRESHOLD
             self._pruning_snapshot = self._clauses[:]
 
@@ -71,19 +106,26 @@ class ConsequenceFinder(object):
         return len(self._clauses)
 
     def run(self):
-        print self.name_to_kill,
+        if self.names_to_kill:
+            print ",".join(str(x) for x in self.names_order[
+                len(Term.BASE_ORDER):]),
+        else:
+            print None,
         # prev = self.state.clauses.copy()
         if self.remove_redundant_clauses:
             self._remove_redundant_clauses()
-        while self._worklist:
+        while self._passive:
             if self.remove_redundant_clauses:
                 if len(self) > self._time_to_prune:
                     self._remove_redundant_clauses()
                     self._time_to_prune = len(self) + self.PRUNE_THRESHOLD
                     continue
 
-            c = self._worklist.pop()
+            c = self._pop_given_clause()
             self._paramodulator.apply_rules(c)
+            # a unit derived from c may have rewritten c itself
+            if c in self.state.clauses:
+                self._index_clause(c)
         if self.remove_redundant_clauses:
             self._remove_redundant_clauses()
         print ".",
@@ -105,19 +147,159 @@ class ConsequenceFinder(object):
 
         self._seen_clauses.add(c)
 
+        if self.demodulate:
+            res = self._demodulate_clause(c)
+            if res is not None:
+                if res is True:
+                    return
+                if not res:
+                    raise EmptyClauseException()
+                if res in self._seen_clauses:
+                    return
+                c = res
+                self._seen_clauses.add(c)
+
         if self.state.is_subsumed(c):
             return
 
         # print "new clause", c
 
-        self._worklist.add(c)
-
         if self.remove_redundant_clauses:
             pos = self._get_clause_position(c)
             self._clauses.insert(pos, c)
         else:
             self._clauses.append(c)
-        self.state.clauses.add(c)
+        order = len(self._clause_order)
+        self._clause_order[c] = order
+        self._passive.add(c)
+        heappush(self._weight_heap, (len(c), c.rank, order, c))
+        heappush(self._age_heap, (order, c))
+        self.state.add_clause(c)
+
+        if self.demodulate:
+            self._add_unit(c)
+
+    def _add_unit(self, c):
+        if len(c) != 1 or not c.is_ground:
+            return
+        l = iter(c).next()
+        if l.sign or l.is_cmp:
+            return
+        lhs, rhs = l.terms
+        res = self.compare_terms(lhs, rhs)
+        if res == 0:
+            return
+        if res < 0:
+            lhs, rhs = rhs, lhs
+        if lhs in self._units:
+            return
+        self._units[lhs] = (rhs, c)
+        self._normal_forms = {}
+
+        # backward demodulation of the clauses which contain lhs
+        for c2 in list(self.state.clauses.with_name(lhs.name)):
+            if c2 is c or c2 not in self.state.clauses:
+                continue
+            res = self._demodulate_clause(c2)
+            if res is None or res is c2:
+                continue
+            self._remove_clause(c2)
+            self.add_to_worklist(res)
+
+    def _remove_clause(self, c):
+        self.state.remove_clauses([c])
+        self._passive.discard(c)
+        self._unindex_clause(c)
+        if c in self._clause_order:
+            self._clauses.remove(c)
+
+    def _normalize_term(self, t):
+        # returns the normal form of t, and the units used to reach it
+        value = self._normal_forms.get(t, None)
+        if value is None:
+            res = t
+            used_units = frozenset()
+            if t.sub_terms:
+                sub_terms = []
+                for x in t.sub_terms:
+                    x, x_units = self._normalize_term(x)
+                    sub_terms.append(x)
+                    used_units |= x_units
+                res = Term.get(t.name, *sub_terms)
+            unit = self._units.get(res, None)
+            if unit is not None:
+                rhs, unit_clause = unit
+                res, rhs_units = self._normalize_term(rhs)
+                used_units |= rhs_units | {unit_clause}
+            value = (res, used_units)
+            self._normal_forms[t] = value
+        return value
+
+    def _demodulate_clause(self, c):
+        # rewrites c with the unit equalities found so far. returns None if
+        # c cannot be rewritten, or if the rewritten clause may not replace
+        # it, because it is out of bounds or c is not larger than the units
+        if not self._units or not c.is_ground:
+            return None
+        used_units = set()
+        literals = set()
+        for l in c:
+            if l.atom is None:
+                literals.add(l)
+                continue
+            terms = []
+            for t in l.terms:
+                t, t_units = self._normalize_term(t)
+                terms.append(t)
+                used_units |= t_units
+            literals.add(Literal.get(Atom.get(*terms), l.sign))
+        if not used_units or c in used_units:
+            return None
+        for unit in used_units:
+            if self.compare_clauses(c, unit) <= 0:
+                return None
+        res = Clause.get(literals)
+        if res is not True and res.rank > self.max_clause_rank:
+            return None
+        return res
+
+    def _pop_given_clause(self):
+        self._given_count += 1
+        if self._given_count % self.AGE_RATIO == 0:
+            heap = self._age_heap
+        else:
+            heap = self._weight_heap
+        while True:
+            c = heappop(heap)[-1]
+            if c in self._passive:
+                self._passive.remove(c)
+                return c
+
+    def _index_clause(self, c):
+        from_terms = set()
+        into_terms = set()
+        for sign, s, t, gamma, delta in self._paramodulator.break_max_lit(c):
+            if not sign:
+                from_terms.add(s)
+            into_terms.update(s.subterm_locs)
+        self._from_index.add(c, from_terms)
+        self._into_index.add(c, into_terms)
+
+    def _unindex_clause(self, c):
+        self._from_index.remove(c)
+        self._into_index.remove(c)
+
+    def get_partners(self, sign, s):
+        # clauses which may superpose with a clause whose maximal side is s.
+        # their positive maximal sides may rewrite a subterm of s, and if s
+        # is positive, it may rewrite a subterm of their maximal sides
+        from_index = self._from_index
+        partners = set()
+        for subterm in s.subterm_locs:
+            partners |= from_index.get_unifiable(subterm)
+        if not sign:
+            partners |= self._into_index.get_unifiable(s)
+        return sorted(partners, key=self._clause_order.__getitem__)
 
     def _get_clause_position(self, c):
         lo = 0
@@ -155,9 +337,10 @@ class ConsequenceFinder(object):
             res = solver.check()
             solver.pop()
             if res == unsat:
-                self.state.clauses.remove(c)
-                self._worklist.discard(c)
+                self.state.remove_clauses([c])
+                self._passive.discard(c)
                 self._clauses.pop(pos)
+                self._unindex_clause(c)
             else:
                 solver.add(c.z3_expr)
                 pos += 1
@@ -316,7 +499,7 @@ class ConsequenceFinder(object):
         if l.atom is None:
             return l.sign is False
         self._solver.push()
-        self._solver.add(l.z3_expr)
+        self._solver.add_literal(l)
         res = self._solver.check() == unsat
         self._solver.pop()
         return res
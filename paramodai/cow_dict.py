@@ -0,0 +1,129 @@
+# Copyright 2017 Or Ozeri
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from itertools import chain
+
+SHARD_COUNT = 16
+SHARD_MASK = SHARD_COUNT - 1
+
+
+class CowDict(object):
+
+    # the dict is split into shards by key hash. copies share their shards,
+    # and a shard is only duplicated the first time a copy writes to it
+
+    __slots__ = "_shards", "_owned"
+
+    def __init__(self):
+        self._shards = [{} for _ in xrange(SHARD_COUNT)]
+        self._owned = [True] * SHARD_COUNT
+
+    def copy(self):
+        res = self.__class__.__new__(self.__class__)
+        res._shards = self._shards[:]
+        res._owned = [False] * SHARD_COUNT
+        self._owned = [False] * SHARD_COUNT
+        return res
+
+    @staticmethod
+    def _copy_shard(shard):
+        return shard.copy()
+
+    def _get_writable_shard(self, key):
+        i = hash(key) & SHARD_MASK
+        if self._owned[i]:
+            return self._shards[i]
+        shard = self._copy_shard(self._shards[i])
+        self._shards[i] = shard
+        self._owned[i] = True
+        return shard
+
+    def get(self, key, default=None):
+        return self._shards[hash(key) & SHARD_MASK].get(key, default)
+
+    def __contains__(self, key):
+        return key in self._shards[hash(key) & SHARD_MASK]
+
+    def __getitem__(self, key):
+        return self._shards[hash(key) & SHARD_MASK][key]
+
+    def __setitem__(self, key, value):
+        self._get_writable_shard(key)[key] = value
+
+    def pop(self, key):
+        return self._get_writable_shard(key).pop(key)
+
+    def discard(self, key):
+        if key in self:
+            self.pop(key)
+
+    def __iter__(self):
+        return chain.from_iterable(self._shards)
+
+    def __len__(self):
+        return sum(map(len, self._shards))
+
+    def __eq__(self, other):
+        # a key is always in the same shard, so equal dicts have equal
+        # shards. shards still shared by copies are not compared
+        for shard, other_shard in zip(self._shards, other._shards):
+            if shard is not other_shard and shard != other_shard:
+                return False
+        return True
+
+    def __ne__(self, other):
+        return not self == other
+
+
+class CowSetDict(CowDict):
+
+    # a CowDict whose values are sets. a copied shard shares its sets with
+    # the original, and a set is only duplicated the first time a copy
+    # writes to it. _owned_keys are the keys whose sets belong to this dict
+
+    __slots__ = ("_owned_keys",)
+
+    def __init__(self):
+        super(CowSetDict, self).__init__()
+        self._owned_keys = set()
+
+    def copy(self):
+        res = super(CowSetDict, self).copy()
+        res._owned_keys = set()
+        self._owned_keys = set()
+        return res
+
+    def _get_writable_set(self, key):
+        shard = self._get_writable_shard(key)
+        items = shard.get(key, None)
+        if items is not None and key not in self._owned_keys:
+            items = items.copy()
+            shard[key] = items
+            self._owned_keys.add(key)
+        return shard, items
+
+    def add(self, key, item):
+        shard, items = self._get_writable_set(key)
+        if items is None:
+            shard[key] = {item}
+            self._owned_keys.add(key)
+        else:
+            items.add(item)
+
+    def remove(self, key, item):
+        shard, items = self._get_writable_set(key)
+        items.remove(item)
+        if not items:
+            del shard[key]
+            self._owned_keys.discard(key)
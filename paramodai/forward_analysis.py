@@ -16,7 +16,8 @@ from paramodai.executable import Executable
 from paramodai.cfg import CFG
 from paramodai.state import AbstractState
 from paramodai.term import Term
-from heapq import heappush, heappop
+from heapq import heapify, heappush, heappop
+from collections import OrderedDict
 
 
 class UndeterminedCallExecption(Exception):
@@ -37,10 +38,24 @@ class BBWorklist(object):
             self._states[bb].append(state)
 
     def pop(self):
-        bb = heappop(self._bb_heap)
+        # blocks taken out of order leave their entries in the heap
+        while True:
+            bb = heappop(self._bb_heap)
+            if bb in self._bb_set:
+                break
         self._bb_set.remove(bb)
         return bb, self._states.pop(bb)
 
+    def take(self, bb):
+        # the states pushed into bb, or None
+        if bb not in self._bb_set:
+            return None
+        self._bb_set.remove(bb)
+        if len(self._bb_heap) > 2 * len(self._bb_set) + 16:
+            self._bb_heap = list(self._bb_set)
+            heapify(self._bb_heap)
+        return self._states.pop(bb)
+
     def clear(self):
         self._bb_heap = []
         self._bb_set = set()
@@ -54,6 +69,22 @@ class ForwardAnalyzer(dict):
 
     debug = 0
 
+    # substitute the compared operands for cmp1/cmp2 in branch conditions
+    FUSE_COMPARES = True
+    # only the clauses linked to the names a block writes take part in its
+    # eliminations, the rest are set aside and put back at its end
+    USE_FRAME = True
+    # visit the blocks in weak topological order, iterating every loop
+    # component until its head is stable before the code after it is
+    # analyzed
+    WTO_ORDER = True
+    # widen at the head of a loop, once WIDENING_DELAY states came into it
+    # by back edges
+    WIDENING = False
+    WIDENING_DELAY = 3
+    # the number of blocks whose per instruction states are kept
+    INSTR_STATES_CACHE_SIZE = 64
+
     def __init__(self, filename):
         super(ForwardAnalyzer, self).__init__(self)
         self.filename = filename
@@ -80,28 +111,21 @@ class ForwardAnalyzer(dict):
             self.cfg = CFG.get(start_addr, self.executable)
         self.worklist = BBWorklist()
         self.delayed_worklist = BBWorklist()
+        self.back_edge_counts = {}
+        self._instr_bbs = None
+        self._instr_states_cache = OrderedDict()
         if start_state is None:
             start_state = self.get_startup_state()
         self.worklist.push(self.cfg.entry_bb, start_state)
 
     def run(self):
+        if self.WTO_ORDER:
+            self._run_elements(self.cfg.wto)
+        # whatever the ordering left behind is done in address order
         while True:
             while self.worklist:
-
                 bb, state_list = self.worklist.pop()
-
-                if self.debug > 0:
-                    print bb
-                    if self.debug > 2:
-                        for state in state_list:
-                            print "-------new--------"
-                            print state
-                        print "--------old-------"
-                        print self.get(bb, None)
-                        print
-                        print
-
-                self._process_item(bb, state_list)
+                self._visit(bb, state_list)
 
             if not self.delayed_worklist:
                 break
@@ -109,71 +133,60 @@ class ForwardAnalyzer(dict):
             bb, state_list = self.delayed_worklist.pop()
             self._process_delayed_item(bb, state_list)
 
+    def _run_elements(self, elements):
+        for x in elements:
+            if isinstance(x, list):
+                self._run_component(x)
+            else:
+                state_list = self.worklist.take(x)
+                if state_list is not None:
+                    self._visit(x, state_list)
+
+    def _run_component(self, component):
+        # the body is run again whenever the head got new states, from the
+        # back edges or from widening, so nested components are stable
+        # before the head is looked at again
+        head = component[0]
+        while True:
+            state_list = self.worklist.take(head)
+            if state_list is not None:
+                self._visit(head, state_list)
+                self._run_elements(component[1:])
+                continue
+            state_list = self.delayed_worklist.take(head)
+            if state_list is None:
+                break
+            self._process_delayed_item(head, state_list)
+
+    def _visit(self, bb, state_list):
+        if self.debug > 0:
+            print bb
+            if self.debug > 2:
+                for state in state_list:
+                    print "-------new--------"
+                    print state
+                print "--------old-------"
+                print self.get(bb, None)
+                print
+                print
+
+        self._process_item(bb, state_list)
+
     def _process_delayed_item(self, bb, state_list):
+        # widening: only the clauses of the loop head state which also
+        # hold in the states of the back edges are kept, so the state of
+        # the head can only shrink from now on
         old_state = self[bb]
         new_state = AbstractState.merge(*state_list)
-        if old_state.is_equivalent(new_state):
+        widened_state = old_state.copy()
+        widened_state.add_consequences()
+        widened_state.remove_noninvariant_clauses(new_state)
+        widened_state.remove_big_clauses()
+        widened_state.compactify()
+        if widened_state == old_state or widened_state.implies(old_state):
             return
-        print "======= old_state ==========="
-        print old_state
-
-        from z3 import unsat
-        s = old_state.get_solver()
-        s.add(Term.get("stk_-c").z3_expr != Term.get(0).z3_expr)
-        s.add(Term.get("stk_8").z3_expr != Term.get("stk_-c").deref().z3_expr)
-        if s.check() != unsat:
-            raise Exception("1")
-
-        # from z3 import unsat
-        # s = old_state.get_solver()
-        # s.add(Term.get("stk_-c").z3_expr != Term.get(0xffffffff).z3_expr)
-        # s.add(Term.get("stk_-18").z3_expr != Term.get("add", Term.get("stk_4"), Term.get("stk_-c")).deref().z3_expr)
-        # if s.check() != unsat:
-        #     raise Exception("1")
-
-        print "======= new_state ==========="
-        print new_state
-
-        from z3 import unsat
-        s = old_state.get_solver()
-        s.add(Term.get("stk_-c").z3_expr != Term.get(0).z3_expr)
-        s.add(Term.get("stk_8").z3_expr != Term.get("stk_-c").deref().z3_expr)
-        if s.check() != unsat:
-            raise Exception("2")
-
-        # s = new_state.get_solver()
-        # s.add(Term.get("stk_-c").z3_expr != Term.get(0xffffffff).z3_expr)
-        # s.add(Term.get("stk_-18").z3_expr != Term.get("add", Term.get("stk_4"),
-        #                                               Term.get(
-        #                                                   "stk_-c")).deref().z3_expr)
-        # if s.check() != unsat:
-        #     raise Exception("2")
-
-        # new_state.compactify()
-        # new_state.add_consequences()
-        # new_state.clauses = {c for c in new_state.clauses if len(c) <= 3}
-        # new_state.remove_noninvariant_clauses(old_state)
-        # new_state.compactify()
-        new_state = AbstractState.merge_two_states(old_state, new_state)
-        print "======= after ==========="
-        print new_state
-
-        from z3 import unsat
-        s = old_state.get_solver()
-        s.add(Term.get("stk_-c").z3_expr != Term.get(0).z3_expr)
-        s.add(Term.get("stk_8").z3_expr != Term.get("stk_-c").deref().z3_expr)
-        if s.check() != unsat:
-            raise Exception("3")
-
-        # s = new_state.get_solver()
-        # s.add(Term.get("stk_-c").z3_expr != Term.get(0xffffffff).z3_expr)
-        # s.add(Term.get("stk_-18").z3_expr != Term.get("add", Term.get("stk_4"),
-        #                                               Term.get(
-        #                                                   "stk_-c")).deref().z3_expr)
-        # if s.check() != unsat:
-        #     raise Exception("3")
         self.pop(bb)
-        self.worklist.push(bb, new_state)
+        self.worklist.push(bb, widened_state)
 
     def _process_item(self, bb, state_list):
         if not self.merge(bb, state_list):
@@ -211,6 +224,41 @@ class ForwardAnalyzer(dict):
     def get_state(self, addr):
         return self[self.cfg[addr]]
 
+    def _get_state_before(self, bb, i):
+        # the states before the instructions of bb are computed in a single
+        # pass, as far as they were asked for. they are valid while the
+        # state of bb is the same object with the same clauses
+        state = self[bb]
+        cache = self._instr_states_cache
+        value = cache.pop(bb, None)
+        if value is None or value[0] is not state or \
+                value[1] != state.fingerprint:
+            value = (state, state.fingerprint, [state])
+            if len(cache) >= self.INSTR_STATES_CACHE_SIZE:
+                cache.popitem(last=False)
+        cache[bb] = value
+        states = value[2]
+        while len(states) <= i:
+            new_state = states[-1].copy()
+            self._apply_instr(new_state, bb.instrs[len(states) - 1])
+            states.append(new_state)
+        return states[i]
+
+    def iter_instr_states(self, bb):
+        # yields every instruction of bb with a copy of the state right
+        # before it
+        for i, instr in enumerate(bb):
+            yield instr, self._get_state_before(bb, i).copy()
+
+    def state_before(self, instr_addr):
+        if self._instr_bbs is None:
+            self._instr_bbs = {}
+            for bb in self.cfg.basic_blocks.itervalues():
+                for i, instr in enumerate(bb):
+                    self._instr_bbs[instr.addr] = (bb, i)
+        bb, i = self._instr_bbs[instr_addr]
+        return self._get_state_before(bb, i).copy()
+
     # def get_contexts(self, addr):
     #     res = []
     #     for ctx in self:
@@ -220,11 +268,24 @@ class ForwardAnalyzer(dict):
 
     def apply_block(self, state, bb):
         new_state = state.copy()
-        for instr in bb:
-            self._apply_instr(new_state, instr)
+        fused_compares = self._get_fused_compares(bb)
+        self._apply_instrs(new_state,
+                           [x for x in bb if x not in fused_compares])
 
         return self._propagate(new_state, bb)
 
+    def _apply_instrs(self, state, instrs):
+        frame = None
+        if self.USE_FRAME and not AbstractState.CONNECTION_ANALYSIS:
+            frame = state.remove_frame(
+                {dst.name for instr in instrs for dst, _ in instr.assignments})
+        for instr in instrs:
+            self._apply_instr(state, instr)
+        if frame:
+            # the pending versions are only linked to the active clauses
+            state.flush_names()
+            state.add_frame(frame)
+
     def set_func_transformer(self, func_name, transformer):
         func_addr = self.executable.symbol_addr[func_name]
         self.func_transformers[func_addr] = transformer
@@ -312,11 +373,26 @@ class ForwardAnalyzer(dict):
         else:
             return self._propagate_intraprocedural(state, bb)
 
+    def _get_fused_compares(self, bb):
+        if not self.FUSE_COMPARES:
+            return frozenset()
+        # the compare path bounds the rank of the operands, the fused
+        # conditions would bring them into the state as they are
+        if bb.fused_rank > AbstractState.MAX_CLAUSE_RANK:
+            return frozenset()
+        return bb.fused_compares
+
     def _propagate_intraprocedural(self, state, bb):
+        # the versions of the block are eliminated once here, rather than
+        # in the copy of every successor edge
+        state.flush_names()
         new_states = [state] + [state.copy()
                                 for i in xrange(bb.succ_edge_count-1)]
 
-        for target, assertions, assignments, is_backward in bb.succ_edges:
+        # a fused compare never assigns cmp1/cmp2, so they need no kill
+        fused = bool(self._get_fused_compares(bb))
+        for target, assertions, assignments, is_backward in \
+                bb.get_succ_edges(fused):
 
             ret_state = new_states.pop()
 
@@ -326,19 +402,25 @@ class ForwardAnalyzer(dict):
                 ret_state.handle_assignment(dst, src)
 
             # optimization
-            ret_state.kill_name("cmp1")
-            ret_state.kill_name("cmp2")
+            if not fused:
+                ret_state.eliminate_names(["cmp1", "cmp2"])
 
             # if is_backward:
             #     print "BACKWARDDD"
             #     print ret_state
             #     raw_input("press any key")
 
-            if is_backward and False:
+            if is_backward and self.WIDENING and \
+                    self._count_back_edge(target) > self.WIDENING_DELAY:
                 self.delayed_worklist.push(target, ret_state)
             else:
                 yield target, ret_state
 
+    def _count_back_edge(self, bb):
+        count = self.back_edge_counts.get(bb, 0) + 1
+        self.back_edge_counts[bb] = count
+        return count
+
     def merge(self, bb, state_list):
         curr_state = self.get(bb, None)
         if curr_state is not None:
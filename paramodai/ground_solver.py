@@ -0,0 +1,405 @@
+# Copyright 2017 Or Ozeri
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from paramodai.clause import Clause
+from paramodai.term import TRUE, FALSE
+from paramodai.instantiation import add_arguments, get_instances, \
+    get_skolem_constant
+from z3 import Solver, sat, unsat
+
+
+class CongruenceClosure(object):
+
+    # backtrackable congruence closure over interned terms.
+    # every change is recorded on a trail, and undone by undo(mark)
+
+    __slots__ = ("_parent", "_class_size", "_uses", "_sigs", "_diseqs",
+                 "_trail", "conflict")
+
+    def __init__(self):
+        self._parent = {}
+        self._class_size = {}
+        self._uses = {}
+        self._sigs = {}
+        self._diseqs = []
+        self._trail = []
+        self.conflict = False
+
+        # the only interpreted values of the z3 encoding
+        self.add_diseq(TRUE, FALSE)
+
+    def copy(self):
+        # the copy starts with an empty trail
+        res = CongruenceClosure.__new__(CongruenceClosure)
+        res._parent = self._parent.copy()
+        res._class_size = self._class_size.copy()
+        res._uses = {t: uses[:] for t, uses in self._uses.iteritems()}
+        res._sigs = self._sigs.copy()
+        res._diseqs = self._diseqs[:]
+        res._trail = []
+        res.conflict = self.conflict
+        return res
+
+    def without_names(self, names):
+        # returns the closure over the terms which mention none of the
+        # names. terms which were in the same class stay in one class
+        names = frozenset(names)
+        res = CongruenceClosure()
+        if self.conflict:
+            res._set_conflict()
+        for members in self.get_classes().itervalues():
+            members = [t for t in members if names.isdisjoint(t.names)]
+            for t in members:
+                res.add_term(t)
+            for t in members[1:]:
+                res.merge(members[0], t)
+        for t1, t2 in self._diseqs:
+            if (t1, t2) not in res._diseqs and \
+                    names.isdisjoint(t1.names) and \
+                    names.isdisjoint(t2.names):
+                res.add_diseq(t1, t2)
+        return res
+
+    def mark(self):
+        return len(self._trail)
+
+    def undo(self, mark):
+        trail = self._trail
+        while len(trail) > mark:
+            entry = trail.pop()
+            kind = entry[0]
+            if kind == "term":
+                t = entry[1]
+                del self._parent[t]
+                del self._class_size[t]
+                del self._uses[t]
+            elif kind == "union":
+                _, child, rep, uses_len = entry
+                self._parent[child] = child
+                self._class_size[rep] -= self._class_size[child]
+                del self._uses[rep][uses_len:]
+            elif kind == "use":
+                self._uses[entry[1]].pop()
+            elif kind == "sig":
+                del self._sigs[entry[1]]
+            elif kind == "diseq":
+                self._diseqs.pop()
+            elif kind == "conflict":
+                self.conflict = False
+
+    def find(self, t):
+        parent = self._parent
+        p = parent[t]
+        while p is not t:
+            t = p
+            p = parent[t]
+        return t
+
+    def get_classes(self):
+        # maps the root of every class to the terms of the class
+        classes = {}
+        for t in self._parent:
+            classes.setdefault(self.find(t), []).append(t)
+        return classes
+
+    def _signature(self, t):
+        return (t.name,) + tuple(self.find(x) for x in t.sub_terms)
+
+    def add_term(self, t):
+        if t in self._parent:
+            return
+        for x in t.sub_terms:
+            self.add_term(x)
+        self._parent[t] = t
+        self._class_size[t] = 1
+        self._uses[t] = []
+        self._trail.append(("term", t))
+        if not t.sub_terms:
+            return
+        for x in t.sub_terms:
+            rep = self.find(x)
+            self._uses[rep].append(t)
+            self._trail.append(("use", rep))
+        sig = self._signature(t)
+        other = self._sigs.get(sig, None)
+        if other is None:
+            self._sigs[sig] = t
+            self._trail.append(("sig", sig))
+        else:
+            self.merge(t, other)
+
+    def _set_conflict(self):
+        if not self.conflict:
+            self.conflict = True
+            self._trail.append(("conflict",))
+
+    def merge(self, t1, t2):
+        self.add_term(t1)
+        self.add_term(t2)
+        pending = [(t1, t2)]
+        while pending:
+            a, b = pending.pop()
+            a = self.find(a)
+            b = self.find(b)
+            if a is b:
+                continue
+            if self._class_size[a] > self._class_size[b]:
+                a, b = b, a
+            b_uses = self._uses[b]
+            self._trail.append(("union", a, b, len(b_uses)))
+            self._parent[a] = b
+            self._class_size[b] += self._class_size[a]
+            for u in self._uses[a]:
+                sig = self._signature(u)
+                other = self._sigs.get(sig, None)
+                if other is None:
+                    self._sigs[sig] = u
+                    self._trail.append(("sig", sig))
+                elif self.find(other) is not self.find(u):
+                    pending.append((u, other))
+            b_uses.extend(self._uses[a])
+
+        for x, y in self._diseqs:
+            if self.find(x) is self.find(y):
+                self._set_conflict()
+                break
+
+    def add_diseq(self, t1, t2):
+        self.add_term(t1)
+        self.add_term(t2)
+        self._diseqs.append((t1, t2))
+        self._trail.append(("diseq",))
+        if self.find(t1) is self.find(t2):
+            self._set_conflict()
+
+    def value(self, lit):
+        # returns the truth value of lit, or None if it is not decided
+        t1, t2, eq = lit
+        self.add_term(t1)
+        self.add_term(t2)
+        r1 = self.find(t1)
+        r2 = self.find(t2)
+        if r1 is r2:
+            return eq
+        for x, y in self._diseqs:
+            x = self.find(x)
+            y = self.find(y)
+            if (x is r1 and y is r2) or (x is r2 and y is r1):
+                return not eq
+        return None
+
+    def assert_literal(self, lit):
+        t1, t2, eq = lit
+        if eq:
+            self.merge(t1, t2)
+        else:
+            self.add_diseq(t1, t2)
+
+
+class GroundSolver(object):
+
+    # decides ground clause sets over uninterpreted functions with
+    # congruence closure and a small DPLL search.
+    # non-ground constraints are either instantiated over the ground
+    # arguments of the query, or handed over to z3 with everything else
+
+    __slots__ = ("_constraints", "_scopes", "_non_ground", "_z3_solver",
+                 "_instantiate")
+
+    def __init__(self, clauses=(), instantiate=False):
+        self._constraints = []
+        self._scopes = []
+        self._non_ground = 0
+        self._z3_solver = None
+        self._instantiate = instantiate
+        for c in clauses:
+            self.add(c)
+
+    @staticmethod
+    def _get_ground_clauses(c, negated):
+        # translates c (or its negation) to tuples of (t1, t2, eq) literals
+        if not c.is_ground:
+            return None
+        if negated:
+            res = []
+            for l in c:
+                if l.atom is None:
+                    if l.sign:
+                        return [()]
+                    continue
+                res.append(((l.terms[0], l.terms[1], l.sign),))
+            return res
+        lits = []
+        for l in c:
+            if l.atom is None:
+                if l.sign:
+                    return []
+                continue
+            lits.append((l.terms[0], l.terms[1], not l.sign))
+        return [tuple(lits)]
+
+    def _add_constraint(self, ground_clauses, obj, negated):
+        self._constraints.append((ground_clauses, obj, negated))
+        if ground_clauses is None:
+            self._non_ground += 1
+        if self._z3_solver is not None:
+            self._z3_solver.add(self._get_z3_expr(obj, negated))
+
+    @staticmethod
+    def _get_z3_expr(obj, negated):
+        if negated:
+            return obj.z3_not_expr
+        return obj.z3_expr
+
+    def add(self, c):
+        self._add_constraint(self._get_ground_clauses(c, False), c, False)
+
+    def add_negation(self, c):
+        if self._instantiate and not c.is_ground:
+            # the negation is existential, so VAR is replaced by a fresh
+            # constant
+            skolemized = c.assign(
+                get_skolem_constant(len(self._constraints)))
+            if skolemized is True:
+                ground_clauses = [()]
+            else:
+                ground_clauses = self._get_ground_clauses(skolemized, True)
+            self._add_constraint(ground_clauses, c, True)
+            return
+        self._add_constraint(self._get_ground_clauses(c, True), c, True)
+
+    def add_literal(self, l):
+        if self._instantiate and not l.is_ground:
+            self.add(Clause.get({l}))
+            return
+        if not l.is_ground:
+            ground_clauses = None
+        elif l.atom is None:
+            ground_clauses = [] if l.sign else [()]
+        else:
+            ground_clauses = [((l.terms[0], l.terms[1], not l.sign),)]
+        self._add_constraint(ground_clauses, l, False)
+
+    def push(self):
+        self._scopes.append(len(self._constraints))
+        if self._z3_solver is not None:
+            self._z3_solver.push()
+
+    def pop(self):
+        n = self._scopes.pop()
+        for ground_clauses, _, _ in self._constraints[n:]:
+            if ground_clauses is None:
+                self._non_ground -= 1
+        del self._constraints[n:]
+        if self._z3_solver is not None:
+            self._z3_solver.pop()
+
+    def check(self):
+        if self._non_ground and not self._instantiate:
+            return self._check_z3()
+
+        clauses = []
+        for ground_clauses, _, _ in self._constraints:
+            if ground_clauses is not None:
+                clauses.extend(ground_clauses)
+        if self._non_ground:
+            clauses.extend(self._get_instances(clauses))
+        if () in clauses:
+            return unsat
+        if self._search(CongruenceClosure(), clauses):
+            return sat
+        return unsat
+
+    def _get_instances(self, clauses):
+        arguments = {}
+        non_ground = []
+        for c in clauses:
+            for t1, t2, _ in c:
+                add_arguments(arguments, t1)
+                add_arguments(arguments, t2)
+        for ground_clauses, obj, _ in self._constraints:
+            if ground_clauses is None:
+                non_ground.append(obj)
+                for l in obj:
+                    if l.atom is not None:
+                        add_arguments(arguments, l.terms[0])
+                        add_arguments(arguments, l.terms[1])
+        res = []
+        for c in non_ground:
+            for instance in get_instances(c, arguments):
+                res.extend(self._get_ground_clauses(instance, False))
+        return res
+
+    def _check_z3(self):
+        solver = self._z3_solver
+        if solver is None:
+            solver = Solver()
+            scopes = self._scopes
+            i = 0
+            for j, (_, obj, negated) in enumerate(self._constraints):
+                while i < len(scopes) and scopes[i] == j:
+                    solver.push()
+                    i += 1
+                solver.add(self._get_z3_expr(obj, negated))
+            while i < len(scopes):
+                solver.push()
+                i += 1
+            self._z3_solver = solver
+        return solver.check()
+
+    def _search(self, cc, clauses):
+        # unit propagation
+        while True:
+            propagated = False
+            open_clauses = []
+            for c in clauses:
+                undecided = []
+                for lit in c:
+                    value = cc.value(lit)
+                    if value:
+                        break
+                    if value is None:
+                        undecided.append(lit)
+                else:
+                    if not undecided:
+                        return False
+                    if len(undecided) == 1:
+                        cc.assert_literal(undecided[0])
+                        if cc.conflict:
+                            return False
+                        propagated = True
+                    else:
+                        open_clauses.append(undecided)
+            clauses = open_clauses
+            if not propagated:
+                break
+
+        if not clauses:
+            return True
+
+        # split on the literals of the shortest open clause
+        c = min(clauses, key=len)
+        mark = cc.mark()
+        for lit in c:
+            cc.assert_literal(lit)
+            if not cc.conflict and self._search(cc, clauses):
+                return True
+            cc.undo(mark)
+            # lit is false in the remaining branches
+            t1, t2, eq = lit
+            cc.assert_literal((t1, t2, not eq))
+            if cc.conflict:
+                return False
+            mark = cc.mark()
+        return False
@@ -0,0 +1,55 @@
+# Copyright 2017 Or Ozeri
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from z3 import Solver, FreshBool, Implies
+
+
+class IncrementalSolver(object):
+
+    # a z3 solver shared between states. every clause is asserted once,
+    # guarded by a tracking literal, and a state is checked by assuming
+    # the tracking literals of its clauses. clauses are interned, so the
+    # same solver can serve any number of states
+
+    MAX_TRACKED_CLAUSES = 20000
+
+    __slots__ = ("_solver", "_tracking")
+
+    def __init__(self):
+        self._solver = Solver()
+        self._tracking = {}
+
+    def _get_tracking_literal(self, c):
+        b = self._tracking.get(c, None)
+        if b is None:
+            b = FreshBool()
+            self._solver.add(Implies(b, c.z3_expr))
+            self._tracking[c] = b
+        return b
+
+    def check(self, clauses, *exprs):
+        if len(self._tracking) > self.MAX_TRACKED_CLAUSES:
+            self.reset()
+        assumptions = [self._get_tracking_literal(c) for c in clauses]
+        if not exprs:
+            return self._solver.check(*assumptions)
+        self._solver.push()
+        self._solver.add(*exprs)
+        res = self._solver.check(*assumptions)
+        self._solver.pop()
+        return res
+
+    def reset(self):
+        self._solver = Solver()
+        self._tracking = {}
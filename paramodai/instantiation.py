@@ -0,0 +1,104 @@
+# Copyright 2017 Or Ozeri
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# replaces the universally quantified VAR of non-ground clauses by the
+# ground terms that appear in the same argument positions elsewhere.
+# the instances are implied by the clauses, so an unsat answer on the
+# instances is an unsat answer on the clauses
+
+from paramodai.term import Term, VAR
+
+SKOLEM_PREFIX = "!sk_"
+
+_arguments_cache = {}
+_var_positions_cache = {}
+
+
+def _get_arguments(t):
+    # returns the (function name, argument index, ground argument) triplets
+    # of all the sub terms of t
+    value = _arguments_cache.get(t, None)
+    if value is None:
+        value = set()
+        for i, x in enumerate(t.sub_terms):
+            if x.is_ground:
+                value.add((t.name, i, x))
+            value |= _get_arguments(x)
+        value = frozenset(value)
+        _arguments_cache[t] = value
+    return value
+
+
+def _get_var_positions(c):
+    # returns the (function name, argument index) pairs in which VAR appears
+    value = _var_positions_cache.get(c, None)
+    if value is None:
+        value = set()
+        for l in c:
+            if l.atom is None:
+                continue
+            for t in l.terms:
+                for subterm, locs in t.subterm_locs.iteritems():
+                    for i, x in enumerate(subterm.sub_terms):
+                        if x is VAR:
+                            value.add((subterm.name, i))
+        value = frozenset(value)
+        _var_positions_cache[c] = value
+    return value
+
+
+def get_skolem_constant(i):
+    return Term.get(SKOLEM_PREFIX + str(i))
+
+
+def add_arguments(arguments, t):
+    for name, i, x in _get_arguments(t):
+        value = arguments.get((name, i), None)
+        if value is None:
+            value = set()
+            arguments[(name, i)] = value
+        value.add(x)
+
+
+def get_instances(c, arguments):
+    values = set()
+    for key in _get_var_positions(c):
+        values |= arguments.get(key, set())
+    res = []
+    for x in values:
+        instance = c.assign(x)
+        if instance is not True:
+            res.append(instance)
+    return res
+
+
+def instantiate(clauses):
+    # returns the ground clauses, followed by the instances of the
+    # non-ground clauses
+    ground = []
+    non_ground = []
+    arguments = {}
+    for c in clauses:
+        if c.is_ground:
+            ground.append(c)
+        else:
+            non_ground.append(c)
+        for l in c:
+            if l.atom is not None:
+                for t in l.terms:
+                    add_arguments(arguments, t)
+
+    for c in non_ground:
+        ground.extend(get_instances(c, arguments))
+    return ground
@@ -12,16 +12,18 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from paramodai.z3_translator import Z3Translator
+
+
 class Literal(object):
 
     _literal_cache = {}
 
-    __slots__ = ("atom", "sign", "_z3_expr")
+    __slots__ = ("atom", "sign")
 
     def __init__(self, atom, sign=False):
         self.atom = atom
         self.sign = sign
-        self._z3_expr = None
 
     @staticmethod
     def get(atom, sign=False):
@@ -45,15 +47,7 @@ class Literal(object):
 
     @property
     def z3_expr(self):
-        value = self._z3_expr
-        if value is None:
-            if self.sign:
-                value = (self.terms[0].z3_expr !=
-                         self.terms[1].z3_expr)
-            else:
-                value = self.atom.z3_expr
-            self._z3_expr = value
-        return value
+        return Z3Translator.get_active().translate_literal(self)
 
     @property
     def rank(self):
@@ -67,17 +61,6 @@ class Literal(object):
             return self
         return Literal.get(self.atom.assign(value), self.sign)
 
-    def assign_z3_expr(self, z3_value):
-        if self.is_ground:
-            return self.z3_expr
-
-        if self.sign:
-            return (self.terms[0].assign_z3_expr(z3_value) !=
-                    self.terms[1].assign_z3_expr(z3_value))
-        else:
-            return (self.terms[0].assign_z3_expr(z3_value) ==
-                    self.terms[1].assign_z3_expr(z3_value))
-
     @property
     def names(self):
         return self.atom.names
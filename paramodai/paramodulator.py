@@ -24,17 +24,14 @@ class Paramodulator(object):
         self._conseq_finder = conseq_finder
         self._breaked_clause_cache = {}
 
-    @property
-    def _clauses(self):
-        return self._conseq_finder._clauses
-
     def apply_rules(self, c):
-        contains_name_to_kill = self._conseq_finder.name_to_kill in c.names
+        names_to_kill = self._conseq_finder.names_to_kill
+        contains_name_to_kill = not names_to_kill.isdisjoint(c.names)
         for sign, s, t, gamma, delta in self.break_max_lit(c):
 
-            for c2 in self._clauses[:]:
+            for c2 in self._conseq_finder.get_partners(sign, s):
                 if (not contains_name_to_kill and
-                        not self._conseq_finder.name_to_kill in c2.names):
+                        names_to_kill.isdisjoint(c2.names)):
                     continue
 
                 if c == c2:
@@ -0,0 +1,93 @@
+# Copyright 2017 Or Ozeri
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from z3 import unsat
+
+
+class Query(object):
+
+    # a property at a program point, given by the z3 expressions of its
+    # negation. the property holds if the state at the point contradicts
+    # all of them together
+
+    __slots__ = ("addr", "exprs", "name", "result")
+
+    def __init__(self, addr, exprs, name=None):
+        self.addr = addr
+        self.exprs = exprs
+        self.name = name
+        self.result = None
+
+    @property
+    def is_proved(self):
+        return self.result == unsat
+
+    def __repr__(self):
+        return "%s @ %x: %s" % (self.name, self.addr, self.result)
+
+
+class QueryEngine(object):
+
+    # checks the queries of an analyzed program, grouped by program
+    # point. the state of every point is asserted once, in a solver of
+    # its own, and every query is checked in a push/pop scope over it.
+    # if an IncrementalSolver is given, it is shared by all the points
+    # instead. a point is the address of a block, which stands for the
+    # state at its start, or of an instruction, which stands for the
+    # state right before it
+
+    __slots__ = ("analyzer", "queries", "_solver")
+
+    def __init__(self, analyzer, solver=None):
+        self.analyzer = analyzer
+        self.queries = []
+        self._solver = solver
+
+    def add(self, addr, exprs, name=None):
+        query = Query(addr, exprs, name)
+        self.queries.append(query)
+        return query
+
+    def _get_state(self, addr):
+        # a copy, as asking a state for its solver flushes its names
+        if addr in self.analyzer.cfg.basic_blocks:
+            return self.analyzer.get_state(addr).copy()
+        return self.analyzer.state_before(addr)
+
+    def run(self):
+        # returns the queries, in the order they were added, with their
+        # results
+        points = {}
+        for query in self.queries:
+            points.setdefault(query.addr, []).append(query)
+
+        for addr in sorted(points):
+            state = self._get_state(addr)
+            if self._solver is not None:
+                state.attach_solver(self._solver)
+                for query in points[addr]:
+                    query.result = state.check_sat(*query.exprs)
+                continue
+            solver = state.get_solver()
+            for query in points[addr]:
+                solver.push()
+                solver.add(*query.exprs)
+                query.result = solver.check()
+                solver.pop()
+
+        return self.queries
+
+    @property
+    def failed(self):
+        return [x for x in self.queries if not x.is_proved]
@@ -19,6 +19,11 @@ from paramodai.x86 import ESP
 
 class StackAnalyzer(ForwardAnalyzer):
 
+    # the fusion uses the operands resolved by this analysis
+    FUSE_COMPARES = False
+    # the states are not clause sets
+    USE_FRAME = False
+
     def get_startup_state(self):
         return {self.executable.parser.STACK_REG: 0}
 
@@ -13,10 +13,15 @@
 # limitations under the License.
 
 from paramodai.clause import Clause
+from paramodai.clause_set import ClauseSet
 from paramodai.atom import Atom
 from paramodai.literal import Literal
 from paramodai.term import Term, TRUE, VAR
 from paramodai.conseq_find import ConsequenceFinder
+from paramodai.ground_solver import GroundSolver, CongruenceClosure
+from paramodai.incremental_solver import IncrementalSolver
+from paramodai.z3_translator import Z3Translator
+from paramodai.instantiation import instantiate
 from z3 import unsat, Solver, And, Not, sat, FreshBool, Implies
 from itertools import product, combinations, permutations
 
@@ -27,48 +32,81 @@ class AbstractState(object):
     MAX_CLAUSE_SIZE = 2
     MAX_CLAUSE_RANK = 2
     CONNECTION_ANALYSIS = False
-
-    __slots__ = "clauses", "_instr"
+    QUANTIFIER_INSTANTIATION = False
+    # assignments rename the killed names to fresh versions, which are
+    # eliminated together at the next join, query or block exit, or once
+    # there are too many of them or the state grew too much since the first
+    VERSIONED_NAMES = False
+    MAX_PENDING_NAMES = 32
+    MAX_PENDING_GROWTH = 16
+    # the ground unit equalities are kept as a congruence closure, and the
+    # rest of the state is rewritten to the representatives of its classes
+    CANONICAL_EQUALITIES = False
+
+    __slots__ = ("clauses", "_instr", "_solver", "_saturation", "_pending",
+                 "_pending_base", "_cc", "_cc_owned")
 
     def __init__(self, clauses=None):
-        if not clauses:
-            clauses = set()
+        if clauses is None:
+            clauses = ClauseSet()
+        elif not isinstance(clauses, ClauseSet):
+            clauses = ClauseSet(clauses)
         self._instr = None
+        self._solver = None
+        # ((k, d), clauses) of the last add_consequences, without the
+        # clauses removed since then. they are closed under the rules, so
+        # only the clauses which are not among them have to be saturated
+        self._saturation = None
+        # versioned names that are still to be eliminated
+        self._pending = []
+        # the size of the state when the first pending name was versioned
+        self._pending_base = 0
+        # the congruence closure of the canonical equalities mode. it holds
+        # every ground unit equality of the state and only facts implied
+        # by it. it is shared with copies until one of them changes it
+        self._cc = None
+        self._cc_owned = False
         self.clauses = clauses
 
     def __contains__(self, clause):
         return clause in self.clauses
 
     def is_subsumed(self, c):
-        if ((1 << len(c)) - 2) < len(self.clauses):
-            for c2 in c.iter_subclauses():
-                if c2 in self.clauses:
-                    return True
-        else:
-            for c2 in self.clauses:
-                if c2 == c:
-                    continue
-                if c2.subsumes(c):
-                    return True
-        return False
+        return self.clauses.is_subsumed(c)
 
     def remove_subsumed_clauses(self):
         subsumed = set()
-        for c in self:
-            if self.is_subsumed(c):
-                subsumed.add(c)
+        for c in sorted(self, key=len):
+            if c not in subsumed:
+                subsumed |= self.clauses.get_subsumed(c)
         self.remove_clauses(subsumed)
 
     def remove_clauses(self, clauses):
+        clauses = list(clauses)
         self.clauses.difference_update(clauses)
+        if self._saturation is not None:
+            saturated = self._saturation[1]
+            for c in clauses:
+                saturated.discard(c)
 
     def add_clause(self, clause):
         if clause is not True:
+            if self._cc is not None and clause not in self.clauses and \
+                    self._is_ground_equality(clause):
+                self._get_cc().merge(*iter(clause).next().terms)
             self.clauses.add(clause)
 
     def copy(self):
         res = AbstractState(self.clauses.copy())
         res._instr = self._instr
+        res._solver = self._solver
+        if self._saturation is not None:
+            params, saturated = self._saturation
+            res._saturation = (params, saturated.copy())
+        res._pending = list(self._pending)
+        res._pending_base = self._pending_base
+        res._cc = self._cc
+        self._cc_owned = False
         return res
 
     def __len__(self):
@@ -127,7 +165,7 @@ class AbstractState(object):
             else:
                 self.add_eq(Term.get(cond, term1, term2), TRUE)
 
-        if self.get_solver().check() == unsat:
+        if self.check_sat() == unsat:
             return False
 
         self.compactify()
@@ -140,9 +178,7 @@ class AbstractState(object):
         if src_term is None:
             if dst_rank > 1:
                 dst_term, tmps = self._eval_sub_terms(dst_term)
-            self.kill(dst_term)
-            for tmp in tmps:
-                self.kill(tmp)
+            self.kill(dst_term, *tmps)
             return
 
         src_rank = src_term.rank
@@ -154,8 +190,7 @@ class AbstractState(object):
                 tmp = Term.get("tmp")
                 self._handle_simple_assignment(tmp, src_term)
                 src_term = tmp
-                for tmp in tmps:
-                    self.kill(tmp)
+                self.eliminate_names([tmp.name for tmp in tmps])
             dst_term, tmps = self._eval_sub_terms(dst_term)
 
         if dst_term.name in src_term.names:
@@ -165,10 +200,9 @@ class AbstractState(object):
 
         self._handle_simple_assignment(dst_term, src_term)
 
-        for tmp in tmps:
-            self.kill(tmp)
         if src_term == Term.get("tmp"):
-            self.kill(src_term)
+            tmps = tmps + [src_term]
+        self.eliminate_names([tmp.name for tmp in tmps])
 
     def _eval_sub_terms(self, term):
         counter = [0]
@@ -186,8 +220,7 @@ class AbstractState(object):
                 tmps.append(tmp)
                 self._handle_simple_assignment(tmp, subterm)
                 subterm = tmp
-                for tmp in tmps2:
-                    self.kill(tmp)
+                self.eliminate_names([tmp.name for tmp in tmps2])
             subterms.append(subterm)
         return Term.get(term.name, *subterms), tmps
 
@@ -246,8 +279,8 @@ class AbstractState(object):
                     Literal.get(Atom.get(terms[u], terms[w]))
                 }))
 
-            for name in sorted(var_names, key=lambda x: repr(x)):
-                self.kill_name("OLD_" + name)
+            self.kill_names(["OLD_" + name for name in
+                             sorted(var_names, key=lambda x: repr(x))])
 
             # end transformer v->f := 0
 
@@ -272,13 +305,15 @@ class AbstractState(object):
                     Literal.get(Atom.get(terms[u], terms[w]), True)
                 }))
 
-            for name in sorted(var_names, key=lambda x: repr(x)):
-                state.kill_name("OLD_" + name)
+            state.kill_names(["OLD_" + name for name in
+                              sorted(var_names, key=lambda x: repr(x))])
 
             state.add_eq(dst.addr, src)
 
             self.clauses = AbstractState.merge_two_states(
                 self, state).clauses
+            self._saturation = None
+            self._cc = None
         else:
             self.kill(dst)
             if src.is_atomic:
@@ -318,21 +353,67 @@ class AbstractState(object):
         #     self.add_eq(dst, Term.get("_".join([
         #         dst.name, hex(self._instr.addr), str(self.counter)])))
 
-    def kill(self, term):
+    def kill(self, term, *terms):
+        # kills all the given terms together
+        self.eliminate_names(
+            [self._prepare_kill(x) for x in (term,) + terms])
+
+    def _prepare_kill(self, term):
+        # returns the name to eliminate in order to kill term
         if term.is_deref:
             addr = term.addr
-            self.clauses = {c.rename(term.name, "d_tmp") for c in self}
+            self.rename(term.name, "d_tmp")
             term = term.rename(term.name, "d_tmp")
             self.add_clause(Clause.get({
                 Literal.get(Atom.get(VAR.deref(), VAR.d_tmp())),
                 Literal.get(Atom.get(VAR, addr))}))
-
-        self.kill_name(term.name)
+        return term.name
+
+    def remove_frame(self, names):
+        # removes and returns the clauses that are not linked to the names.
+        # a clause is linked if it mentions one of the names, or a name
+        # that a linked clause equates to something
+        active = set()
+        linked = set(names)
+        pending = list(linked)
+        while pending:
+            for c in self.clauses.with_name(pending.pop()):
+                if c in active:
+                    continue
+                active.add(c)
+                for l in c.pos_lits:
+                    if l.is_cmp:
+                        continue
+                    for name in l.names - linked:
+                        linked.add(name)
+                        pending.append(name)
+        frame = [c for c in self.clauses if c not in active]
+        self.remove_clauses(frame)
+        # the closure would bring the equalities of the frame back
+        self._cc = None
+        return frame
+
+    def add_frame(self, frame):
+        for c in frame:
+            self.add_clause(c)
+        self.compactify()
 
     def rename(self, old_name, new_name):
-        self.clauses = {c.rename(old_name, new_name) for c in self}
+        renamed = list(self.clauses.with_name(old_name))
+        self.remove_clauses(renamed)
+        self._forget_names([old_name])
+        for c in renamed:
+            self.add_clause(c.rename(old_name, new_name))
 
     def is_equivalent(self, state):
+        self.flush_names()
+        state.flush_names()
+        if self.clauses == state.clauses:
+            return True
+        if self.QUANTIFIER_INSTANTIATION or \
+                (self.is_ground and state.is_ground):
+            return self.implies(state) and state.implies(self)
+
         solver = Solver()
         b1, b2 = FreshBool(), FreshBool()
         solver.add(b1 == self.z3_expr)
@@ -351,10 +432,39 @@ class AbstractState(object):
         # return True
         return solver.check() == unsat
 
+    def implies(self, state):
+        self.flush_names()
+        state.flush_names()
+        solver = self.get_ground_solver()
+        for c in state:
+            if c in self.clauses:
+                continue
+            solver.push()
+            solver.add_negation(c)
+            res = solver.check()
+            solver.pop()
+            if res != unsat:
+                return False
+        return True
+
+    def _get_saturated_clauses(self):
+        if self._saturation is None:
+            return None
+        params, saturated = self._saturation
+        if params != (self.MAX_CLAUSE_SIZE, self.MAX_CLAUSE_RANK):
+            return None
+        return saturated
+
     def add_consequences(self):
+        saturated = self._get_saturated_clauses()
+        if saturated is not None and len(saturated) == len(self.clauses):
+            return
         ConsequenceFinder(
-            self, name_to_kill=None, max_clause_size=self.MAX_CLAUSE_SIZE,
-            max_clause_rank=self.MAX_CLAUSE_RANK).run()
+            self, names_to_kill=None, max_clause_size=self.MAX_CLAUSE_SIZE,
+            max_clause_rank=self.MAX_CLAUSE_RANK,
+            saturated_clauses=saturated).run()
+        self._saturation = ((self.MAX_CLAUSE_SIZE, self.MAX_CLAUSE_RANK),
+                            self.clauses.get_members())
 
         # prev_clauses = set()
         # while prev_clauses != self.clauses:
@@ -365,41 +475,188 @@ class AbstractState(object):
         for name in names_to_kill:
             state_copy = self.copy()
             ConsequenceFinder(
-                state_copy, name, max_clause_size=self.MAX_CLAUSE_SIZE,
+                state_copy, [name], max_clause_size=self.MAX_CLAUSE_SIZE,
                 max_clause_rank=self.MAX_CLAUSE_RANK).run()
             self.clauses |= state_copy.clauses
 
     def remove_noninvariant_clauses(self, state):
-        solver = state.get_solver()
+        self.flush_names()
+        state.flush_names()
+        solver = state.get_ground_solver()
         to_remove = []
         for c in self:
             solver.push()
-            solver.add(c.z3_not_expr)
+            solver.add_negation(c)
             res = solver.check()
             solver.pop()
             if res != unsat:
                 to_remove.append(c)
 
         self.remove_clauses(to_remove)
+        self._cc = None
 
     def kill_name(self, name):
+        self.kill_names([name])
+
+    def eliminate_names(self, names):
+        # kills the names, or in the versioned names mode renames them to
+        # fresh versions that are killed later by flush_names
+        if not self.VERSIONED_NAMES:
+            self.kill_names(names)
+            return
+        if not self._pending:
+            self._pending_base = len(self.clauses)
+        for name in names:
+            if not self.clauses.with_name(name):
+                continue
+            version = "%s#%d" % (name, self.counter)
+            self.rename(name, version)
+            self._pending.append(version)
+        if len(self._pending) > self.MAX_PENDING_NAMES or \
+                len(self.clauses) > \
+                self._pending_base + self.MAX_PENDING_GROWTH:
+            self.flush_names()
+
+    def flush_names(self):
+        pending = self._pending
+        if pending:
+            self._pending = []
+            self.kill_names(pending)
+
+    def kill_names(self, names):
+        # eliminates all the names in a single saturation
+        if not names:
+            return
+        if self.CANONICAL_EQUALITIES:
+            # the killed names are left only in equalities to their
+            # representatives
+            self.normalize_equalities(names)
         # print "\nkilling", term
         # print "\n", self, "\n"
-        ConsequenceFinder(self, name, max_clause_size=self.MAX_CLAUSE_SIZE,
+        ConsequenceFinder(self, names, max_clause_size=self.MAX_CLAUSE_SIZE,
                           max_clause_rank=self.MAX_CLAUSE_RANK).run()
         # print "\nafter", self, "\n"
         # self.strengthen_clauses()
-        to_kill = [c for c in self.clauses if name in c.names]
+        to_kill = set()
+        for name in names:
+            to_kill.update(self.clauses.with_name(name))
 
         self.remove_clauses(to_kill)
+        self._forget_names(names)
         self.compactify()
 
     def compactify(self):
+        if self.CANONICAL_EQUALITIES:
+            self.normalize_equalities()
         self.remove_subsumed_clauses()
         # self.strengthen_clauses()
         # self.remove_subsumed_clauses()
         # self.remove_derived_clauses()
 
+    @staticmethod
+    def _is_ground_equality(c):
+        if len(c) != 1 or not c.is_ground:
+            return False
+        l = iter(c).next()
+        return not l.sign and l.atom is not None
+
+    @staticmethod
+    def _get_representative_key(t, avoided_names):
+        # constants and booleans are the preferred representatives, and
+        # names that are about to be killed are the least preferred
+        return (t.name in avoided_names, not (t.is_const or t.is_bool),
+                repr(t.name))
+
+    def _get_cc(self):
+        # built from the ground unit equalities on first use, and kept up
+        # to date by add_clause and _forget_names from then on
+        if self._cc is None:
+            cc = CongruenceClosure()
+            for c in self:
+                if self._is_ground_equality(c):
+                    cc.merge(*iter(c).next().terms)
+            self._cc = cc
+            self._cc_owned = True
+        elif not self._cc_owned:
+            self._cc = self._cc.copy()
+            self._cc_owned = True
+        return self._cc
+
+    def _forget_names(self, names):
+        # the classes of the closure lose the terms which mention the names
+        if self._cc is not None:
+            self._cc = self._cc.without_names(names)
+            self._cc_owned = True
+
+    def normalize_equalities(self, avoided_names=()):
+        eqs = [c for c in self if self._is_ground_equality(c)]
+        if not eqs:
+            return
+
+        cc = self._get_cc()
+        if cc.conflict:
+            return
+
+        # every class is represented by its preferred atomic term, or else
+        # by a term of minimal rank. the sub terms of a representative have
+        # a smaller rank, so normalization terminates
+        classes = cc.get_classes()
+        reps = {}
+        for root, members in classes.iteritems():
+            atomic = [t for t in members if t.is_atomic]
+            if atomic:
+                reps[root] = min(atomic, key=lambda x:
+                                 self._get_representative_key(
+                                     x, avoided_names))
+            else:
+                reps[root] = min(members, key=lambda x: (x.rank, repr(x)))
+
+        normal_forms = {}
+
+        def normalize(t):
+            value = normal_forms.get(t, None)
+            if value is None:
+                rep = t
+                if t.is_ground:
+                    cc.add_term(t)
+                    rep = reps.get(cc.find(t), t)
+                if rep.is_atomic:
+                    value = rep
+                else:
+                    value = Term.get(rep.name,
+                                     *[normalize(x) for x in rep.sub_terms])
+                normal_forms[t] = value
+            return value
+
+        # a spanning set of equalities over the normalized terms
+        new_eqs = set()
+        for root, members in classes.iteritems():
+            if len(members) == 1:
+                continue
+            rep = normalize(root)
+            for t in members:
+                if not t.is_atomic:
+                    t = Term.get(t.name, *[normalize(x) for x in t.sub_terms])
+                if t is not rep:
+                    new_eqs.add(Clause.get({Literal.get(Atom.get(t, rep))}))
+
+        to_remove = set(eqs)
+        to_add = new_eqs
+        for c in self:
+            if c in to_remove:
+                continue
+            new_c = Clause.get({
+                Literal.get(Atom.get(*[normalize(t) for t in l.terms]),
+                            l.sign)
+                if l.atom is not None else l for l in c})
+            if new_c is not c:
+                to_remove.add(c)
+                to_add.add(new_c)
+        to_remove -= to_add
+        self.remove_clauses(to_remove)
+        for c in to_add:
+            self.add_clause(c)
+
     def remove_derived_clauses(self):
         clauses = sorted(self, key=lambda x: (len(x), x.rank, id(x)))
         solver = Solver()
@@ -414,7 +671,7 @@ class AbstractState(object):
                 solver.add(c.z3_expr)
             else:
                 solver.pop()
-                self.clauses.remove(c)
+                self.remove_clauses([c])
 
     def strengthen_clauses(self):
         lits = set()
@@ -444,7 +701,8 @@ class AbstractState(object):
             if needed != c.literals:
                 to_add.add(Clause.get(needed))
 
-        self.clauses |= to_add
+        for c in to_add:
+            self.add_clause(c)
         self.remove_subsumed_clauses()
 
     def __iter__(self):
@@ -459,14 +717,49 @@ class AbstractState(object):
         return self.clauses != other.clauses
 
     def get_solver(self):
+        self.flush_names()
         solver = Solver()
-        for c in self:
-            solver.add(c.z3_expr)
+        solver.add(*Z3Translator.get_active().translate_clauses(
+            self._get_query_clauses()))
+        return solver
+
+    def get_ground_solver(self):
+        return GroundSolver(self, self.QUANTIFIER_INSTANTIATION)
+
+    def _get_query_clauses(self):
+        if self.QUANTIFIER_INSTANTIATION:
+            return instantiate(self)
+        return self
+
+    def attach_solver(self, solver=None):
+        # the attached solver is shared with all copies of this state
+        if solver is None:
+            solver = self._solver or IncrementalSolver()
+        self._solver = solver
         return solver
 
+    def detach_solver(self):
+        self._solver = None
+
+    def check_sat(self, *exprs):
+        if self._solver is not None:
+            return self._solver.check(self._get_query_clauses(), *exprs)
+        if not exprs:
+            return self.get_ground_solver().check()
+        solver = self.get_solver()
+        solver.add(*exprs)
+        return solver.check()
+
+    @property
+    def is_ground(self):
+        for c in self:
+            if not c.is_ground:
+                return False
+        return True
+
     @property
     def z3_expr(self):
-        return And(*[c.z3_expr for c in self])
+        return And(*Z3Translator.get_active().translate_clauses(self))
 
     @property
     def counter(self):
@@ -492,13 +785,17 @@ class AbstractState(object):
             {c for c in self
              if len(c) > self.MAX_CLAUSE_SIZE
              or c.rank > self.MAX_CLAUSE_RANK})
+        self._cc = None
 
     @property
     def names(self):
-        names = set()
-        for c in self:
-            names |= c.names
-        return names
+        return self.clauses.names
+
+    @property
+    def fingerprint(self):
+        # an order independent hash of the clauses, kept up to date on
+        # every change. equal states have equal fingerprints
+        return self.clauses.fingerprint
 
     @property
     def atomic_names(self):
@@ -509,6 +806,8 @@ class AbstractState(object):
 
     @staticmethod
     def merge(*states):
+        for state in states:
+            state.flush_names()
         to_merge = list(states)
 
         while len(to_merge) > 1:
@@ -528,14 +827,32 @@ class AbstractState(object):
             state1.add_consequences()
             state2.add_consequences()
 
+        max_size = AbstractState.MAX_CLAUSE_SIZE
+        max_rank = AbstractState.MAX_CLAUSE_RANK
         merged = state1 & state2
-        s1_leftovers = state1 - merged
-        s2_leftovers = state2 - merged
-
+        s1_leftovers = sorted((c for c in state1 - merged
+                               if len(c) <= max_size and c.rank <= max_rank),
+                              key=len)
+        s2_leftovers = sorted((c for c in state2 - merged
+                               if len(c) <= max_size and c.rank <= max_rank),
+                              key=len)
+
+        # pairs which are too big, or subsumed by the common part or by
+        # the pairs before them, are not turned into clauses
+        clauses = merged.clauses
         for c1, c2 in product(s1_leftovers, s2_leftovers):
-            merged.add_clause(c1 | c2)
+            literals = c1.literals | c2.literals
+            if len(literals) > max_size or \
+                    clauses.subsumes_literals(literals):
+                continue
+            merged.add_clause(Clause.get(literals))
 
         merged.remove_big_clauses()
         merged.compactify()
 
+        if AbstractState.CANONICAL_EQUALITIES:
+            # the consequences are needed only by the join itself
+            state1.normalize_equalities()
+            state2.normalize_equalities()
+
         return merged
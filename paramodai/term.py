@@ -12,9 +12,6 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from z3 import Function, IntSort, Int, BoolVal
-import operator
-
 VAR_NAME = "!!x"
 DEREF_NAME = "deref"
 
@@ -22,33 +19,28 @@ DEREF_NAME = "deref"
 class Term(object):
 
     _terms_cache = {}
+    # the number of terms made so far. the arguments of add and mul are
+    # sorted by when they were made rather than by where they are in
+    # memory, so the same run always builds the same terms
+    _next_order = 0
 
     BASE_ORDER = ["add", "neg", "mul", DEREF_NAME]
 
-    __slots__ = ("name", "sub_terms", "_z3_expr", "rank", "names",
-                 "atomic_names", "subterm_locs", "_replacements_cache")
+    __slots__ = ("name", "sub_terms", "rank", "names", "atomic_names",
+                 "subterm_locs", "_replacements_cache", "order")
 
     MUL_FUNCS = {"add", "mul"}
 
-    Z3_FUNCS = {"add": operator.add,
-                "neg": operator.neg,
-                "mul": operator.mul,
-                "eq": operator.eq,
-                "ne": operator.ne,
-                "ge": operator.ge,
-                "gt": operator.gt,
-                "le": operator.le,
-                "lt": operator.lt}
-
     def __init__(self, name, *sub_terms):
         self.name = name
         self.sub_terms = sub_terms
-        self._z3_expr = None
         self.subterm_locs = self._get_subterm_locs()
         self._replacements_cache = {}
         self.rank = self._get_rank()
         self.names = self._get_names()
         self.atomic_names = self._get_atomic_names()
+        self.order = Term._next_order
+        Term._next_order += 1
 
     def __repr__(self):
         if self.is_bool:
@@ -97,7 +89,7 @@ class Term(object):
         cache = Term._terms_cache
 
         if name in Term.MUL_FUNCS:
-            sub_terms = tuple(sorted(sub_terms))
+            sub_terms = tuple(sorted(sub_terms, key=Term.get_order))
 
         if isinstance(name, bool):
             # to avoid collisions: True == 1, False == 0
@@ -113,6 +105,10 @@ class Term(object):
 
         return value
 
+    @staticmethod
+    def get_order(term):
+        return term.order
+
     def simplify(self):
 
         if self.name == "add":
@@ -311,43 +307,9 @@ class Term(object):
 
     @property
     def z3_expr(self):
-        expr = self._z3_expr
-        if expr is None:
-            if self.is_atomic:
-                if self.is_const:
-                    # expr = IntVal(self.name)
-                    expr = Int(str(self.name))
-                elif self.is_bool:
-                    expr = BoolVal(self.name[0])
-                else:
-                    expr = Int(self.name)
-            else:
-                sub_exprs = [x.z3_expr for x in self.sub_terms]
-                expr = self._apply_z3_func(*sub_exprs)
-            self._z3_expr = expr
-        return expr
-
-    def _apply_z3_func(self, *sub_exprs):
-        func = self.Z3_FUNCS.get(self.name, None)
-        if True or func is None:
-            func = Function(
-                *([self.name] +
-                  [IntSort()] * (self.arity + 1)))
-            self.Z3_FUNCS[self.name] = func
-
-        return func(*sub_exprs)
-
-    def assign_z3_expr(self, z3_value):
-        if self.is_ground:
-            return self.z3_expr
-        if self.is_var:
-            return z3_value
-
-        assert not self.is_atomic
-
-        sub_exprs = [x.assign_z3_expr(z3_value) for x in self.sub_terms]
-
-        return self._apply_z3_func(*sub_exprs)
+        # imported here, since the translator depends on this module
+        from paramodai.z3_translator import Z3Translator
+        return Z3Translator.get_active().translate_term(self)
 
     def deref(self):
         return Term.get(DEREF_NAME, self)
@@ -0,0 +1,58 @@
+# Copyright 2017 Or Ozeri
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+class TermIndex(object):
+
+    # maps terms to the clauses they were indexed for. a ground term only
+    # unifies with itself or with a non-ground term, so ground queries look
+    # up the exact term and add the (few) clauses with non-ground entries
+
+    __slots__ = "_terms", "_ground", "_non_ground"
+
+    def __init__(self):
+        self._terms = {}
+        self._ground = {}
+        self._non_ground = set()
+
+    def add(self, c, terms):
+        self._terms[c] = terms
+        ground = self._ground
+        for t in terms:
+            if t.is_ground:
+                clauses = ground.get(t, None)
+                if clauses is None:
+                    ground[t] = {c}
+                else:
+                    clauses.add(c)
+            else:
+                self._non_ground.add(c)
+
+    def remove(self, c):
+        terms = self._terms.pop(c, ())
+        ground = self._ground
+        for t in terms:
+            if t.is_ground:
+                clauses = ground[t]
+                clauses.discard(c)
+                if not clauses:
+                    del ground[t]
+        self._non_ground.discard(c)
+
+    def get_unifiable(self, term):
+        if not term.is_ground:
+            return set(self._terms)
+        res = set(self._non_ground)
+        res.update(self._ground.get(term, ()))
+        return res
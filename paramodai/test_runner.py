@@ -1,5 +1,6 @@
 import time
 from paramodai.state import AbstractState
+from paramodai.z3_translator import Z3Translator
 
 
 def run_test(test_func, argv):
@@ -17,6 +18,9 @@ def run_test(test_func, argv):
     AbstractState.MAX_CLAUSE_SIZE = max_clause
     AbstractState.MAX_CLAUSE_RANK = max_rank
 
+    # every test gets its own z3 expressions
+    Z3Translator().activate()
+
     t = time.time()
     res = True
     try:
@@ -24,14 +24,10 @@ class UnorderedParamodulator(object):
         self._conseq_finder = conseq_finder
         self._breaked_clause_cache = {}
 
-    @property
-    def _clauses(self):
-        return self._conseq_finder._clauses
-
     def apply_rules(self, c):
         for sign, s, t, gamma, delta in self.break_max_lit(c):
 
-            for c2 in self._clauses[:]:
+            for c2 in self._conseq_finder.get_partners(sign, s):
                 if c == c2:
                     continue
 
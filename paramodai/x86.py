@@ -12,7 +12,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from paramodai.term import Term, ZERO, ONE
+from paramodai.term import Term, ZERO, ONE, DEREF_NAME
 from paramodai.instruction import Instruction, RETURN_ADDR
 import distorm3
 
@@ -70,6 +70,47 @@ class X86Instruction(Instruction):
     def next_instr_addr(self):
         return self.addr + self.length
 
+    def fuse_compare(self, instrs):
+        # substitutes the operands of the last compare in instrs for
+        # cmp1/cmp2 in the successor edges of this instruction, so the
+        # compare need not be applied. returns (compares, successors),
+        # where compares are the skipped instructions
+        successors = self.successors
+        if not any(t in CMP_TERMS
+                   for _, assertions, _ in successors
+                   for _, t1, t2 in assertions
+                   for t in (t1, t2)):
+            return frozenset(), successors
+
+        clobbered = []
+        compares = set()
+        operands = None
+        for instr in reversed(instrs):
+            assignments = instr.assignments
+            if assignments and assignments[0][0] in CMP_TERMS:
+                if operands is None:
+                    operands = dict(assignments)
+                compares.add(instr)
+            elif operands is None:
+                clobbered.extend(dst for dst, _ in assignments)
+        if operands is None or len(operands) != 2:
+            return frozenset(), successors
+
+        # the compared operands must be intact at this instruction
+        for dst in clobbered:
+            for op in operands.itervalues():
+                if dst in op.subterm_locs:
+                    return frozenset(), successors
+                if dst.is_deref and DEREF_NAME in op.names:
+                    return frozenset(), successors
+
+        fused_successors = []
+        for addr, assertions, assignments in successors:
+            assertions = [(cond, operands.get(t1, t1), operands.get(t2, t2))
+                          for cond, t1, t2 in assertions]
+            fused_successors.append((addr, assertions, assignments))
+        return frozenset(compares), fused_successors
+
     @staticmethod
     def parse_mnemonic_and_operands(instr_text):
         mnemonic_end_pos = instr_text.find(" ")
@@ -435,6 +476,7 @@ EBP = Term.get("EBP")
 
 cmp1 = Term.get("cmp1")
 cmp2 = Term.get("cmp2")
+CMP_TERMS = {cmp1, cmp2}
 
 WORD = Term.get(2)
 DWORD = Term.get(4)
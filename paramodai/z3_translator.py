@@ -0,0 +1,119 @@
+# Copyright 2017 Or Ozeri
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from paramodai.term import VAR
+from z3 import Function, IntSort, Int, BoolVal, Or, Not, ForAll
+
+
+class Z3Translator(object):
+
+    # translates terms, literals and clauses to z3 expressions.
+    # function symbols are uninterpreted, and declared once per
+    # (name, arity). VAR is translated to a single constant, which is
+    # bound by the ForAll of every non-ground clause
+
+    _active = None
+
+    __slots__ = ("_func_decls", "_term_exprs", "_literal_exprs",
+                 "_clause_exprs", "_clause_not_exprs")
+
+    def __init__(self):
+        self._func_decls = {}
+        self.clear()
+
+    @staticmethod
+    def get_active():
+        value = Z3Translator._active
+        if value is None:
+            value = Z3Translator()
+            Z3Translator._active = value
+        return value
+
+    def activate(self):
+        Z3Translator._active = self
+
+    def clear(self):
+        # releases the cached expressions. function declarations are kept
+        self._term_exprs = {}
+        self._literal_exprs = {}
+        self._clause_exprs = {}
+        self._clause_not_exprs = {}
+
+    def get_func_decl(self, name, arity):
+        key = (name, arity)
+        value = self._func_decls.get(key, None)
+        if value is None:
+            value = Function(*([name] + [IntSort()] * (arity + 1)))
+            self._func_decls[key] = value
+        return value
+
+    def translate_term(self, t):
+        value = self._term_exprs.get(t, None)
+        if value is None:
+            if t.is_atomic:
+                if t.is_const:
+                    value = Int(str(t.name))
+                elif t.is_bool:
+                    value = BoolVal(t.name[0])
+                else:
+                    value = Int(t.name)
+            else:
+                func = self.get_func_decl(t.name, t.arity)
+                value = func(*[self.translate_term(x) for x in t.sub_terms])
+            self._term_exprs[t] = value
+        return value
+
+    def translate_atom(self, a):
+        return (self.translate_term(a.terms[0]) ==
+                self.translate_term(a.terms[1]))
+
+    def translate_literal(self, l):
+        value = self._literal_exprs.get(l, None)
+        if value is None:
+            if l.atom is None:
+                value = BoolVal(l.sign)
+            elif l.sign:
+                value = (self.translate_term(l.terms[0]) !=
+                         self.translate_term(l.terms[1]))
+            else:
+                value = self.translate_atom(l.atom)
+            self._literal_exprs[l] = value
+        return value
+
+    def translate_clause(self, c):
+        value = self._clause_exprs.get(c, None)
+        if value is None:
+            if not c:
+                value = BoolVal(False)
+            else:
+                sub_exprs = [self.translate_literal(l) for l in c]
+                if len(sub_exprs) == 1:
+                    value = sub_exprs[0]
+                else:
+                    value = Or(*sub_exprs)
+                if not c.is_ground:
+                    value = ForAll(self.translate_term(VAR), value)
+            self._clause_exprs[c] = value
+        return value
+
+    def translate_clause_negation(self, c):
+        value = self._clause_not_exprs.get(c, None)
+        if value is None:
+            value = Not(self.translate_clause(c))
+            self._clause_not_exprs[c] = value
+        return value
+
+    def translate_clauses(self, clauses):
+        translate_clause = self.translate_clause
+        return [translate_clause(c) for c in clauses]
@@ -0,0 +1,24 @@
+from paramodai.atom import Atom
+from paramodai.clause import Clause
+from paramodai.conseq_find import ConsequenceFinder
+from paramodai.literal import Literal
+from paramodai.state import AbstractState
+from paramodai.term import Term
+
+
+def eq(t1, t2, sign=False):
+    return Literal.get(Atom.get(Term.get(t1), Term.get(t2)), sign)
+
+
+def test_rewritten_given_clause_is_not_indexed():
+    # y != b is given first. superposing y == b into it derives the unit
+    # x == a, which rewrites the given clause itself to true
+    given = Clause.get({eq("x", "a"), eq("y", "b")})
+    other = Clause.get({eq("y", "b", True)})
+    state = AbstractState([given, other])
+    finder = ConsequenceFinder(state, ["x", "y"])
+    finder.run()
+
+    assert Clause.get({eq("x", "a")}) in state
+    assert given not in state
+    assert given not in finder.get_partners(False, Term.get("y"))
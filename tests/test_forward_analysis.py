@@ -0,0 +1,72 @@
+from paramodai.atom import Atom
+from paramodai.clause import Clause
+from paramodai.forward_analysis import BBWorklist, ForwardAnalyzer
+from paramodai.literal import Literal
+from paramodai.state import AbstractState
+from paramodai.term import Term
+
+
+def eq(t1, t2):
+    return Clause.get({Literal.get(Atom.get(Term.get(t1), Term.get(t2)))})
+
+
+class Instr(object):
+
+    def __init__(self, *assignments):
+        self.assignments = list(assignments)
+
+
+def test_frame_skips_elimination():
+    # EAX := 1 only touches the clauses linked to EAX
+    analyzer = ForwardAnalyzer.__new__(ForwardAnalyzer)
+    state = AbstractState([eq("EAX", "a"), eq("EBX", "EAX"), eq("ECX", "b")])
+    seen = []
+    kill_names = AbstractState.kill_names
+
+    def recording_kill_names(self, names):
+        seen.append(set(self))
+        kill_names(self, names)
+
+    AbstractState.kill_names = recording_kill_names
+    try:
+        analyzer._apply_instrs(
+            state, [Instr((Term.get("EAX"), Term.get(1)))])
+    finally:
+        AbstractState.kill_names = kill_names
+
+    assert seen
+    for clauses in seen:
+        assert eq("ECX", "b") not in clauses
+        assert eq("EBX", "EAX") in clauses
+    assert eq("ECX", "b") in state
+    assert eq("EBX", "a") in state
+    assert eq("EAX", 1) in state
+
+
+def test_wto_stabilizes_inner_component_first():
+    # 0 -> [1 -> 2 -> [3 -> 4] -> 5] -> 6, where 4 goes back to 3 on its
+    # odd visits and 5 goes back to 1 on its first one
+    analyzer = ForwardAnalyzer.__new__(ForwardAnalyzer)
+    analyzer.worklist = BBWorklist()
+    analyzer.delayed_worklist = BBWorklist()
+    visits = []
+
+    def process_item(bb, state_list):
+        visits.append(bb)
+        count = visits.count(bb)
+        if bb == 4:
+            succ = 3 if count % 2 else 5
+        elif bb == 5:
+            succ = 1 if count == 1 else 6
+        elif bb == 6:
+            return
+        else:
+            succ = bb + 1
+        analyzer.worklist.push(succ, None)
+
+    analyzer._process_item = process_item
+    analyzer.worklist.push(0, None)
+    analyzer._run_elements([0, [1, 2, [3, 4], 5], 6])
+
+    assert visits == [0, 1, 2, 3, 4, 3, 4, 5, 1, 2, 3, 4, 3, 4, 5, 6]
+    assert not analyzer.worklist
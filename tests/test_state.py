@@ -0,0 +1,78 @@
+from paramodai.atom import Atom
+from paramodai.clause import Clause
+from paramodai.literal import Literal
+from paramodai.state import AbstractState
+from paramodai.term import Term
+
+
+def eq(t1, t2, sign=False):
+    return Clause.get({Literal.get(Atom.get(Term.get(t1), Term.get(t2)),
+                                   sign)})
+
+
+def test_saturation_survives_add_clause():
+    state = AbstractState([eq("x", "a"), eq("y", "x")])
+    state.add_consequences()
+    saturated = state._get_saturated_clauses()
+    assert len(saturated) == len(state)
+
+    new = eq("z", "b")
+    state.add_clause(new)
+    saturated = state._get_saturated_clauses()
+    assert saturated is not None
+    assert new not in saturated
+    assert len(saturated) == len(state) - 1
+
+    state.remove_clauses([eq("x", "a")])
+    assert eq("x", "a") not in saturated
+    assert len(saturated) == len(state) - 1
+
+    copy = state.copy()
+    copy.add_consequences()
+    assert len(copy._get_saturated_clauses()) == len(copy)
+    assert len(state._get_saturated_clauses()) == len(state) - 1
+
+
+def test_versioned_names_flush_on_growth():
+    AbstractState.VERSIONED_NAMES = True
+    try:
+        state = AbstractState()
+        growth = AbstractState.MAX_PENDING_GROWTH
+        for i in xrange(growth):
+            state.add_clause(eq("r%d" % i, "a"))
+            state.eliminate_names(["r%d" % i])
+        assert len(state._pending) == growth
+
+        state.add_clause(eq("r%d" % growth, "a"))
+        state.eliminate_names(["r%d" % growth])
+        assert not state._pending
+        assert not [x for x in state.names if "#" in str(x)]
+    finally:
+        AbstractState.VERSIONED_NAMES = False
+
+
+def test_canonical_equalities_closure_is_kept():
+    AbstractState.CANONICAL_EQUALITIES = True
+    try:
+        state = AbstractState([eq("x", "a")])
+        state.compactify()
+        cc = state._cc
+        assert cc is not None
+
+        state.add_clause(eq("y", "x"))
+        state.compactify()
+        assert state._cc is cc
+        assert cc.find(Term.get("y")) is cc.find(Term.get("a"))
+
+        copy = state.copy()
+        copy.add_clause(eq("z", "a"))
+        assert state._cc is cc
+        assert copy._cc is not cc
+        assert eq("z", "a") not in state
+
+        state.kill_names(["x"])
+        cc = state._cc
+        assert cc.find(Term.get("y")) is cc.find(Term.get("a"))
+        assert "x" not in state.names
+    finally:
+        AbstractState.CANONICAL_EQUALITIES = False
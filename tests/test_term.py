@@ -0,0 +1,10 @@
+from paramodai.atom import Atom
+from paramodai.term import Term
+
+
+def test_args_sorted_by_creation():
+    a = Term.get("order_test_a")
+    b = Term.get("order_test_b")
+    assert Term.get("add", b, a).sub_terms == (a, b)
+    assert Term.get("mul", a, b).sub_terms == (a, b)
+    assert Atom.get(b, a).terms == (a, b)